@@ -0,0 +1,83 @@
+import hashlib
+from database import DB_PATH, transaction
+
+
+class ArtifactStore:
+    """Content-addressed store of every file set we deploy, keyed by repo and commit SHA.
+
+    File contents live once in `artifact_blobs` (keyed by SHA-256), so the LICENSE
+    and workflow shared by every repo are stored a single time. `artifact_heads`
+    tracks the latest commit deployed to each repo.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.init()
+
+    def init(self):
+        with transaction(self.db_path) as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS artifact_blobs (
+                    sha TEXT PRIMARY KEY,
+                    content TEXT NOT NULL
+                )
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    repo TEXT NOT NULL,
+                    commit_sha TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    blob_sha TEXT NOT NULL,
+                    PRIMARY KEY (repo, commit_sha, path)
+                )
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS artifact_heads (
+                    repo TEXT PRIMARY KEY,
+                    commit_sha TEXT NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+    def save(self, repo, commit_sha, files):
+        """Record `files` as the content of `repo` at `commit_sha` and make it the repo's head."""
+        with transaction(self.db_path) as cur:
+            for path, content in files.items():
+                blob_sha = hashlib.sha256(content.encode()).hexdigest()
+                cur.execute("INSERT OR IGNORE INTO artifact_blobs (sha, content) VALUES (?, ?)", (blob_sha, content))
+                cur.execute(
+                    "INSERT OR REPLACE INTO artifacts (repo, commit_sha, path, blob_sha) VALUES (?, ?, ?, ?)",
+                    (repo, commit_sha, path, blob_sha),
+                )
+            cur.execute(
+                "INSERT INTO artifact_heads (repo, commit_sha) VALUES (?, ?) "
+                "ON CONFLICT (repo) DO UPDATE SET commit_sha=excluded.commit_sha, updated_at=CURRENT_TIMESTAMP",
+                (repo, commit_sha),
+            )
+
+    def head(self, repo):
+        with transaction(self.db_path) as cur:
+            cur.execute("SELECT commit_sha FROM artifact_heads WHERE repo=?", (repo,))
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    def files(self, repo, commit_sha=None):
+        """Return {path: content} for `repo` at `commit_sha` (default: head), or None if unknown."""
+        commit_sha = commit_sha or self.head(repo)
+        if not commit_sha:
+            return None
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                "SELECT a.path, b.content FROM artifacts a JOIN artifact_blobs b ON b.sha = a.blob_sha "
+                "WHERE a.repo=? AND a.commit_sha=?",
+                (repo, commit_sha),
+            )
+            rows = cur.fetchall()
+        return dict(rows) if rows else None
+
+    def file(self, repo, path, commit_sha=None):
+        files = self.files(repo, commit_sha)
+        return files.get(path) if files else None
+
+
+artifact_store = ArtifactStore()
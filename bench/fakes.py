@@ -0,0 +1,253 @@
+"""Local stand-ins for the OpenAI-compatible LLM API, GitHub REST and raw.githubusercontent.com.
+
+Run with `uvicorn bench.fakes:app`. Point the service at it with
+OPENAI_BASE_URL=<fake>/v1, GITHUB_API_URL=<fake>/github and GITHUB_RAW_URL=<fake>/raw.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+
+FAKE_LLM_LATENCY = float(os.environ.get("FAKE_LLM_LATENCY", "2.0"))
+FAKE_LLM_JITTER = float(os.environ.get("FAKE_LLM_JITTER", "0.5"))
+FAKE_GITHUB_LATENCY = float(os.environ.get("FAKE_GITHUB_LATENCY", "0.05"))
+FAKE_LOGIN = os.environ.get("FAKE_GITHUB_LOGIN", "bench-user")
+FAKE_PAGES_BUILD = float(os.environ.get("FAKE_PAGES_BUILD", "1.0"))
+
+FAKE_HTML = "<!DOCTYPE html>\n<html><head><title>Bench</title></head><body><h1>Hello</h1></body></html>"
+
+app = FastAPI(title="Load-test fakes")
+
+# repo name -> {"repo": json, "head": sha, "files": {path: content}, "pages": bool, "built_at": time}
+repos = {}
+trees = {}
+commits = {}
+blobs = {}
+
+
+def _sha(*parts):
+    return hashlib.sha1("\0".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _blob_sha(content):
+    data = content.encode()
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+async def _github_delay():
+    await asyncio.sleep(random.uniform(0, 2 * FAKE_GITHUB_LATENCY))
+
+
+def _conditional(req, data):
+    """Answer a GET like GitHub: with an ETag, and 304 when If-None-Match matches it."""
+    etag = f'W/"{_sha(json.dumps(data, sort_keys=True))}"'
+    if req.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(data, headers={"ETag": etag})
+
+
+def _move_head(name, sha):
+    repos[name]["head"] = sha
+    repos[name]["files"] = trees.get(commits[sha]["tree"]["sha"], {})
+    repos[name]["built_at"] = time.time() + FAKE_PAGES_BUILD
+
+
+def _pages_json(req, name):
+    return {"html_url": f"{req.base_url}site/{name}/", "status": "built", "build_type": "legacy"}
+
+
+def _repo_json(name):
+    return {
+        "name": name,
+        "full_name": f"{FAKE_LOGIN}/{name}",
+        "html_url": f"https://github.com/{FAKE_LOGIN}/{name}",
+        "default_branch": "main",
+    }
+
+
+# --- OpenAI-compatible chat completions ---
+
+@app.post("/v1/chat/completions")
+async def chat_completions(req: Request):
+    body = await req.json()
+    latency = max(0.0, random.gauss(FAKE_LLM_LATENCY, FAKE_LLM_JITTER))
+    completion_id = f"chatcmpl-{_sha(time.time(), random.random())[:12]}"
+    if body.get("stream"):
+        return StreamingResponse(_stream_completion(completion_id, body.get("model", "fake"), latency),
+                                 media_type="text/event-stream")
+    await asyncio.sleep(latency)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": FAKE_HTML},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150},
+    }
+
+
+async def _stream_completion(completion_id, model, latency, chunk_size=16):
+    pieces = [FAKE_HTML[i:i + chunk_size] for i in range(0, len(FAKE_HTML), chunk_size)]
+    for piece in pieces:
+        await asyncio.sleep(latency / len(pieces))
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+# --- GitHub REST ---
+
+@app.get("/github/user")
+async def user(req: Request):
+    await _github_delay()
+    return _conditional(req, {"login": FAKE_LOGIN})
+
+
+@app.post("/github/user/repos")
+async def create_repo(req: Request):
+    body = await req.json()
+    await _github_delay()
+    name = body["name"]
+    if name in repos:
+        return JSONResponse({"message": "Repository creation failed.",
+                             "errors": [{"message": "name already exists on this account"}]}, status_code=422)
+    head = _sha(name, "init")
+    commits[head] = {"sha": head, "tree": {"sha": _sha(head, "tree")}, "parents": []}
+    repos[name] = {"repo": _repo_json(name), "head": head, "files": {}, "pages": False, "built_at": 0.0}
+    return JSONResponse(repos[name]["repo"], status_code=201)
+
+
+@app.get("/github/repos/{owner}/{name}")
+async def get_repo(owner: str, name: str, req: Request):
+    await _github_delay()
+    if name not in repos:
+        return JSONResponse({"message": "Not Found"}, status_code=404)
+    return _conditional(req, repos[name]["repo"])
+
+
+@app.post("/github/repos/{owner}/{name}/git/trees")
+async def create_tree(owner: str, name: str, req: Request):
+    body = await req.json()
+    await _github_delay()
+    files = dict(trees.get(body.get("base_tree"), {}))
+    for entry in body["tree"]:
+        if "content" in entry:
+            blobs[_blob_sha(entry["content"])] = entry["content"]
+            files[entry["path"]] = entry["content"]
+        elif entry.get("sha") is None:
+            files.pop(entry["path"], None)
+        elif entry["sha"] in blobs:
+            files[entry["path"]] = blobs[entry["sha"]]
+        else:
+            return JSONResponse({"message": "GitHub validation failed."}, status_code=422)
+    sha = _sha(sorted(files.items()))
+    trees[sha] = files
+    return JSONResponse({"sha": sha}, status_code=201)
+
+
+@app.post("/github/repos/{owner}/{name}/git/commits")
+async def create_commit(owner: str, name: str, req: Request):
+    body = await req.json()
+    await _github_delay()
+    sha = _sha(body["tree"], body.get("parents"), time.time())
+    commits[sha] = {"sha": sha, "tree": {"sha": body["tree"]}, "parents": [{"sha": p} for p in body.get("parents", [])]}
+    return JSONResponse(commits[sha], status_code=201)
+
+
+@app.get("/github/repos/{owner}/{name}/git/commits/{sha}")
+async def get_commit(owner: str, name: str, sha: str):
+    await _github_delay()
+    if sha not in commits:
+        return JSONResponse({"message": "Not Found"}, status_code=404)
+    return commits[sha]
+
+
+@app.get("/github/repos/{owner}/{name}/git/ref/heads/main")
+async def get_ref(owner: str, name: str):
+    await _github_delay()
+    if name not in repos:
+        return JSONResponse({"message": "Not Found"}, status_code=404)
+    return {"ref": "refs/heads/main", "object": {"sha": repos[name]["head"], "type": "commit"}}
+
+
+@app.patch("/github/repos/{owner}/{name}/git/refs/heads/main")
+async def update_ref(owner: str, name: str, req: Request):
+    body = await req.json()
+    await _github_delay()
+    if name not in repos:
+        return JSONResponse({"message": "Reference does not exist"}, status_code=422)
+    parents = [p["sha"] for p in commits[body["sha"]]["parents"]]
+    if not body.get("force") and repos[name]["head"] not in parents:
+        return JSONResponse({"message": "Update is not a fast forward"}, status_code=422)
+    _move_head(name, body["sha"])
+    return {"ref": "refs/heads/main", "object": {"sha": body["sha"]}}
+
+
+@app.post("/github/repos/{owner}/{name}/git/refs")
+async def create_ref(owner: str, name: str, req: Request):
+    body = await req.json()
+    await _github_delay()
+    _move_head(name, body["sha"])
+    return JSONResponse({"ref": body["ref"], "object": {"sha": body["sha"]}}, status_code=201)
+
+
+@app.put("/github/repos/{owner}/{name}/contents/{path:path}")
+async def put_contents(owner: str, name: str, path: str):
+    await _github_delay()
+    return JSONResponse({"commit": {"sha": repos[name]["head"]}}, status_code=201)
+
+
+@app.post("/github/repos/{owner}/{name}/pages")
+async def create_pages(owner: str, name: str, req: Request):
+    await _github_delay()
+    if repos[name]["pages"]:
+        return JSONResponse({"message": "GitHub Pages is already enabled."}, status_code=409)
+    repos[name]["pages"] = True
+    return JSONResponse(_pages_json(req, name), status_code=201)
+
+
+@app.get("/github/repos/{owner}/{name}/pages")
+async def get_pages(owner: str, name: str, req: Request):
+    await _github_delay()
+    if name not in repos or not repos[name]["pages"]:
+        return JSONResponse({"message": "Not Found"}, status_code=404)
+    return _pages_json(req, name)
+
+
+@app.get("/github/repos/{owner}/{name}/pages/builds/latest")
+async def latest_build(owner: str, name: str):
+    await _github_delay()
+    if name not in repos or not repos[name]["pages"]:
+        return JSONResponse({"message": "Not Found"}, status_code=404)
+    built = time.time() >= repos[name]["built_at"]
+    return {"status": "built" if built else "building", "commit": repos[name]["head"], "error": {"message": None}}
+
+
+@app.get("/site/{name}/")
+async def site(name: str):
+    if name not in repos or not repos[name]["pages"] or time.time() < repos[name]["built_at"]:
+        return PlainTextResponse("404: Not Found", status_code=404)
+    return Response(repos[name]["files"].get("index.html", ""), media_type="text/html")
+
+
+# --- raw.githubusercontent.com ---
+
+@app.get("/raw/{owner}/{name}/main/{path:path}")
+async def raw(owner: str, name: str, path: str):
+    if name not in repos or path not in repos[name]["files"]:
+        return PlainTextResponse("404: Not Found", status_code=404)
+    return PlainTextResponse(repos[name]["files"][path])
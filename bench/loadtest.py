@@ -0,0 +1,193 @@
+"""End-to-end load test of /api-endpoint against local fakes.
+
+Boots bench.fakes and the service (main:app) as uvicorn subprocesses, hosts an
+evaluation sink in-process, replays submissions at a fixed rate and reports
+end-to-end latency (submission -> evaluation callback) and throughput.
+
+    python -m bench.loadtest --rate 20 --count 500
+    python -m bench.loadtest --payloads submissions.jsonl --llm-latency 1.5
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET = "bench-secret"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def load_payloads(path, count):
+    if path:
+        with open(path) as f:
+            base = [json.loads(line) for line in f if line.strip()]
+        return [dict(base[i % len(base)]) for i in range(count)]
+    # Distinct briefs so every synthetic task misses the LLM cache.
+    return [{
+        "email": "bench@example.com",
+        "task": "bench-task",
+        "round": 1,
+        "brief": f"Create a page that shows the current time and a button that refreshes it (variant {i}).",
+        "checks": [],
+        "attachments": [],
+    } for i in range(count)]
+
+
+def spawn(module_app, port, env):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module_app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+
+
+async def wait_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def run(args):
+    fakes_port, app_port, sink_port = free_port(), free_port(), free_port()
+    fakes_url = f"http://127.0.0.1:{fakes_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    sink_url = f"http://127.0.0.1:{sink_port}/callback"
+
+    # Evaluation sink: records when each callback arrives.
+    received = {}
+    sink = FastAPI()
+
+    @sink.post("/callback")
+    async def callback(req: Request):
+        body = await req.json()
+        received.setdefault((body["nonce"], body["round"]), time.monotonic())
+        return {"ok": True}
+
+    sink_server = uvicorn.Server(uvicorn.Config(sink, host="127.0.0.1", port=sink_port, log_level="warning"))
+    sink_task = asyncio.create_task(sink_server.serve())
+
+    tmp = tempfile.mkdtemp(prefix="bench-")
+    env = {
+        **os.environ,
+        "FAKE_LLM_LATENCY": str(args.llm_latency),
+        "FAKE_LLM_JITTER": str(args.llm_jitter),
+        "FAKE_GITHUB_LATENCY": str(args.github_latency),
+        "FAKE_PAGES_BUILD": str(args.pages_build),
+    }
+    fakes = spawn("bench.fakes:app", fakes_port, env)
+    service = spawn("main:app", app_port, {
+        **env,
+        "DB_PATH": os.path.join(tmp, "tasks.db"),
+        "STORED_SECRET_HASH": hashlib.sha256(SECRET.encode()).hexdigest(),
+        "GITHUB_TOKEN": "bench-token",
+        "GITHUB_USER": "bench-user",
+        "OPENAI_API_KEY": "bench-key",
+        "OPENAI_BASE_URL": f"{fakes_url}/v1",
+        "GITHUB_API_URL": f"{fakes_url}/github",
+        "GITHUB_RAW_URL": f"{fakes_url}/raw",
+        "LLM_CACHE_TTL": "0" if args.no_cache else os.environ.get("LLM_CACHE_TTL", "86400"),
+        "OUTBOX_BASE_DELAY": "0.1",
+        "PAGES_POLL_MIN": "0.5",
+    })
+
+    try:
+        await wait_ready(f"{fakes_url}/github/user")
+        await wait_ready(f"{app_url}/metrics")
+
+        payloads = load_payloads(args.payloads, args.count)
+        sent = {}
+        ack_latencies = []
+        errors = 0
+
+        async with httpx.AsyncClient(timeout=30) as client:
+            async def submit(payload):
+                nonlocal errors
+                if not args.keep_nonces or "nonce" not in payload:
+                    payload["nonce"] = str(uuid.uuid4())
+                payload.update(secret=SECRET, evaluation_url=sink_url)
+                key = (payload["nonce"], payload["round"])
+                start = time.monotonic()
+                sent.setdefault(key, start)
+                try:
+                    r = await client.post(f"{app_url}/api-endpoint", json=payload)
+                    r.raise_for_status()
+                    ack_latencies.append(time.monotonic() - start)
+                except httpx.HTTPError as e:
+                    errors += 1
+                    print(f"submit failed: {e}")
+
+            t0 = time.monotonic()
+            submissions = []
+            for i, payload in enumerate(payloads):
+                await asyncio.sleep(max(0.0, t0 + i / args.rate - time.monotonic()))
+                submissions.append(asyncio.create_task(submit(payload)))
+            await asyncio.gather(*submissions)
+
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline and len(received) < len(sent):
+            await asyncio.sleep(0.2)
+
+        e2e = [received[k] - sent[k] for k in sent if k in received]
+        elapsed = (max(received.values()) - t0) if received else float("nan")
+        print()
+        print(f"submitted:     {len(sent)} at {args.rate}/s ({errors} submit errors)")
+        print(f"completed:     {len(e2e)} ({len(sent) - len(e2e)} missing after {args.timeout}s)")
+        print(f"throughput:    {len(e2e) / elapsed:.2f} tasks/s")
+        print(f"ack latency:   p50={percentile(ack_latencies, 50) * 1000:.1f}ms "
+              f"p95={percentile(ack_latencies, 95) * 1000:.1f}ms p99={percentile(ack_latencies, 99) * 1000:.1f}ms")
+        print(f"end-to-end:    p50={percentile(e2e, 50):.2f}s p95={percentile(e2e, 95):.2f}s p99={percentile(e2e, 99):.2f}s")
+    finally:
+        for proc in (service, fakes):
+            proc.terminate()
+            proc.wait(timeout=10)
+        sink_server.should_exit = True
+        await sink_task
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payloads", help="JSONL file of submissions to replay (cycled to --count)")
+    parser.add_argument("--count", type=int, default=200, help="number of submissions to send")
+    parser.add_argument("--rate", type=float, default=10.0, help="submissions per second")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for callbacks after the last submit")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="mean fake LLM latency (s)")
+    parser.add_argument("--llm-jitter", type=float, default=0.5, help="stddev of fake LLM latency (s)")
+    parser.add_argument("--github-latency", type=float, default=0.05, help="mean fake GitHub latency (s)")
+    parser.add_argument("--pages-build", type=float, default=1.0, help="seconds the fake Pages build takes after a push")
+    parser.add_argument("--keep-nonces", action="store_true", help="reuse nonces from --payloads (exercises dedup)")
+    parser.add_argument("--no-cache", action="store_true", help="disable the LLM response cache")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
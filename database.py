@@ -1,14 +1,209 @@
+import os
 import sqlite3
+import threading
+from contextlib import contextmanager
+from enum import StrEnum
 
-DB_PATH = "./tasks.db"
+DB_PATH = os.environ.get("DB_PATH", "./tasks.db")
 
+# Ensure DB writable (Hugging Face-safe)
+try:
+    os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+    with open(os.path.join(os.path.dirname(DB_PATH) or ".", ".db_write_test"), "w") as f:
+        f.write("")
+except (OSError, IOError):
+    DB_PATH = "/tmp/tasks.db"
+    os.makedirs("/tmp", exist_ok=True)
 
-def query_all_tasks():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, email, task, round, nonce, status, created_at FROM tasks ORDER BY created_at DESC"
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", "30"))
+SQLITE_STATEMENT_CACHE = int(os.environ.get("SQLITE_STATEMENT_CACHE", "256"))
+SQLITE_CACHE_KB = int(os.environ.get("SQLITE_CACHE_KB", "16384"))
+
+_local = threading.local()
+
+
+def _open(path, check_same_thread=True):
+    conn = sqlite3.connect(
+        path, timeout=SQLITE_BUSY_TIMEOUT, cached_statements=SQLITE_STATEMENT_CACHE,
+        check_same_thread=check_same_thread,
     )
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    # WAL lets readers run alongside the single writer; NORMAL sync is durable across app crashes in WAL mode.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_connection(db_path=None):
+    """Return this thread's long-lived connection to `db_path` (default DB_PATH).
+
+    Connections are per thread, so callers on the event loop and in
+    asyncio.to_thread workers never share one; keeping them open lets
+    sqlite3 reuse its prepared statements.
+    """
+    path = db_path or DB_PATH
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    if path not in conns:
+        conns[path] = _open(path)
+    return conns[path]
+
+
+@contextmanager
+def transaction(db_path=None):
+    """Yield a cursor; commit on success, roll back on error."""
+    conn = get_connection(db_path)
+    cur = conn.cursor()
+    try:
+        yield cur
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+class TaskStatus(StrEnum):
+    RECEIVED = "received"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+_STATUS_LIST = ", ".join(f"'{status}'" for status in TaskStatus)
+
+# Schema migrations for the tasks table, applied in order. PRAGMA user_version
+# records how many have run; append new steps, never edit old ones.
+MIGRATIONS = [
+    # 1: original table
+    [
+        """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY,
+            email TEXT,
+            task TEXT,
+            round INTEGER,
+            nonce TEXT,
+            secret_hash TEXT,
+            brief TEXT,
+            evaluation_url TEXT,
+            status TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ],
+    # 2: one row per (nonce, round); older databases may hold evaluator retries, keep the first
+    [
+        "DELETE FROM tasks WHERE id NOT IN (SELECT MIN(id) FROM tasks GROUP BY nonce, round)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_nonce_round ON tasks (nonce, round)",
+    ],
+    # 3: status becomes an enum; free-text failure reasons move to `error`
+    [
+        "ALTER TABLE tasks ADD COLUMN error TEXT",
+        "ALTER TABLE tasks ADD COLUMN updated_at DATETIME",
+        "UPDATE tasks SET error = trim(substr(status, 8)), status = 'failed' WHERE status LIKE 'failed:%'",
+        "UPDATE tasks SET status = 'completed' WHERE status LIKE 'completed%'",
+        f"UPDATE tasks SET status = 'received' WHERE status IS NULL OR status NOT IN ({_STATUS_LIST})",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS tasks_status_insert BEFORE INSERT ON tasks
+        WHEN NEW.status NOT IN ({_STATUS_LIST})
+        BEGIN SELECT RAISE(ABORT, 'invalid task status'); END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS tasks_status_update BEFORE UPDATE OF status ON tasks
+        WHEN NEW.status NOT IN ({_STATUS_LIST})
+        BEGIN SELECT RAISE(ABORT, 'invalid task status'); END
+        """,
+    ],
+    # 4: indexes for the hot queries (nonce lookups use idx_tasks_nonce_round's leading column)
+    [
+        "CREATE INDEX IF NOT EXISTS idx_tasks_task_round ON tasks (task, round)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks (created_at)",
+    ],
+    # 5: filtered /tasks pages walk (column, created_at) in order instead of sorting every match
+    [
+        "DROP INDEX IF EXISTS idx_tasks_status",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_status_created_at ON tasks (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_email_created_at ON tasks (email, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_tasks_task_created_at ON tasks (task, created_at)",
+    ],
+]
+
+
+def init_db():
+    """Bring the tasks schema up to date, one migration per transaction.
+
+    The version is re-read under the write lock, so several processes starting on
+    the same database apply each migration exactly once.
+    """
+    conn = get_connection()
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        with transaction() as cur:
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("PRAGMA user_version")
+            if cur.fetchone()[0] >= number:
+                continue  # another process got there first
+            for sql in statements:
+                cur.execute(sql)
+            cur.execute(f"PRAGMA user_version={number}")
+        print(f"🗄️ Applied tasks schema migration {number}")
+
+
+def set_task_status(nonce, round_number, status, error=None):
+    with transaction() as cur:
+        cur.execute(
+            "UPDATE tasks SET status=?, error=?, updated_at=CURRENT_TIMESTAMP WHERE nonce=? AND round=?",
+            (status, error, nonce, round_number),
+        )
+
+
+TASK_COLUMNS = ("id", "email", "task", "round", "nonce", "status", "created_at", "error", "updated_at")
+
+
+def _task_query(email=None, task=None, status=None, round_number=None, before=None):
+    """Build the SELECT for tasks newest first. `before` is a (created_at, id) keyset position."""
+    clauses, params = [], []
+    for column, value in (("email", email), ("task", task), ("status", status), ("round", round_number)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if before is not None:
+        clauses.append("(created_at, id) < (?, ?)")
+        params.extend(before)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f"SELECT {', '.join(TASK_COLUMNS)} FROM tasks {where} ORDER BY created_at DESC, id DESC"
+    return sql, params
+
+
+def query_tasks(limit, **filters):
+    """Return one page of task rows (at most `limit`), newest first."""
+    sql, params = _task_query(**filters)
+    with transaction() as cur:
+        cur.execute(f"{sql} LIMIT ?", (*params, limit))
+        return cur.fetchall()
+
+
+def iter_tasks(batch_size=500, **filters):
+    """Yield task rows newest first without materialising the result set.
+
+    Uses its own connection: a streaming response may resume the generator on a
+    different thread each time.
+    """
+    sql, params = _task_query(**filters)
+    conn = _open(DB_PATH, check_same_thread=False)
+    try:
+        cur = conn.execute(sql, params)
+        while rows := cur.fetchmany(batch_size):
+            yield from rows
+    finally:
+        conn.close()
+
+
+def query_all_tasks():
+    return list(iter_tasks())
@@ -0,0 +1,207 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from metrics import GITHUB_RATE_LIMITED_TOTAL
+
+# === CONFIG ===
+GITHUB_MAX_CONCURRENCY = int(os.getenv("GITHUB_MAX_CONCURRENCY", "20"))
+# GitHub's documented secondary limit is 80 content-creating requests per minute.
+GITHUB_WRITES_PER_MINUTE = int(os.getenv("GITHUB_WRITES_PER_MINUTE", "80"))
+# Below this many remaining core requests, spread the rest evenly until the reset.
+GITHUB_RATE_RESERVE = int(os.getenv("GITHUB_RATE_RESERVE", "100"))
+GITHUB_RATE_LIMIT_RETRIES = int(os.getenv("GITHUB_RATE_LIMIT_RETRIES", "4"))
+
+# Lower runs first: finish deployments already under way before starting new repos.
+PRIORITY_DEPLOY = 0
+PRIORITY_NEW_REPO = 1
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+class PriorityLock:
+    """asyncio lock whose waiters are woken lowest priority value first, FIFO within a priority."""
+
+    def __init__(self):
+        self.locked = False
+        self.waiters = []
+        self.seq = itertools.count()
+
+    async def acquire(self, priority):
+        if not self.locked and not self.waiters:
+            self.locked = True
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # handed the lock just as we were cancelled
+            raise
+
+    def release(self):
+        while self.waiters:
+            _, _, fut = heapq.heappop(self.waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.locked = False
+
+
+class PriorityTokenBucket:
+    """Token bucket refilled at `per_minute` units per minute whose waiters are served
+    lowest priority value first. Nobody holds a lock while waiting for a refill, so
+    higher-priority callers that arrive later still go next.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self.waiters = []
+        self.seq = itertools.count()
+        self._refiller = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, priority):
+        self._refill()
+        if self.tokens >= 1 and not self.waiters:
+            self.tokens -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.seq), fut))
+        if self._refiller is None or self._refiller.done():
+            self._refiller = asyncio.create_task(self._hand_out())
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.tokens += 1  # granted just as we were cancelled
+            raise
+
+    async def _hand_out(self):
+        while self.waiters:
+            self._refill()
+            while self.tokens >= 1 and self.waiters:
+                _, _, fut = heapq.heappop(self.waiters)
+                if not fut.done():
+                    fut.set_result(None)
+                    self.tokens -= 1
+            if self.waiters:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class TokenBudget:
+    """What GitHub last told us about one token's quota."""
+
+    def __init__(self, writes_per_minute=GITHUB_WRITES_PER_MINUTE):
+        self.remaining = None
+        self.reset_at = 0.0  # epoch seconds
+        self.paused_until = 0.0  # epoch seconds
+        self.strikes = 0
+        self.admission = PriorityLock()
+        self.writes = PriorityTokenBucket(writes_per_minute) if writes_per_minute > 0 else None
+
+    def delay(self):
+        """Seconds to wait before the next request may be sent."""
+        now = time.time()
+        if self.paused_until > now:
+            return self.paused_until - now
+        if self.remaining is None or self.reset_at <= now:
+            return 0.0
+        if self.remaining <= 0:
+            return self.reset_at - now
+        if self.remaining < GITHUB_RATE_RESERVE:
+            return (self.reset_at - now) / self.remaining
+        return 0.0
+
+
+def _rate_limit_pause(r, budget):
+    """Seconds to back off if `r` is a primary or secondary rate-limit answer, else None."""
+    if r.status_code not in (403, 429):
+        return None
+    if "retry-after" in r.headers:
+        GITHUB_RATE_LIMITED_TOTAL.labels("secondary").inc()
+        return float(r.headers["retry-after"])
+    if r.headers.get("x-ratelimit-remaining") == "0":
+        GITHUB_RATE_LIMITED_TOTAL.labels("primary").inc()
+        return max(1.0, float(r.headers.get("x-ratelimit-reset", 0)) - time.time())
+    if "secondary rate limit" in r.text.lower():
+        # No Retry-After: GitHub asks for at least a minute, growing on repeats.
+        GITHUB_RATE_LIMITED_TOTAL.labels("secondary").inc()
+        return 60 * 2 ** min(budget.strikes, 4) * random.uniform(1, 1.25)
+    return None
+
+
+class GitHubScheduler:
+    """Single gate for every GitHub API call.
+
+    Tracks X-RateLimit-Remaining/Reset per token, pauses the token on primary
+    or secondary limits (honouring Retry-After), paces write requests and spreads
+    the last GITHUB_RATE_RESERVE calls over the window. Callers waiting on a
+    token are admitted in priority order, so deployments already in progress
+    go before new repo creation.
+    """
+
+    def __init__(self, max_in_flight=GITHUB_MAX_CONCURRENCY, retries=GITHUB_RATE_LIMIT_RETRIES):
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.retries = retries
+        self.budgets = {}
+
+    def budget(self, token):
+        if token not in self.budgets:
+            self.budgets[token] = TokenBudget()
+        return self.budgets[token]
+
+    def remaining(self, token):
+        """Core requests GitHub says `token` has left in the current window, or None if unknown."""
+        budget = self.budgets.get(token)
+        if budget is None or budget.remaining is None or budget.reset_at <= time.time():
+            return None
+        return budget.remaining
+
+    async def _admit(self, budget, method, priority):
+        await budget.admission.acquire(priority)
+        try:
+            while (delay := budget.delay()) > 0:
+                await asyncio.sleep(delay)
+            if budget.remaining is not None:
+                budget.remaining -= 1
+        finally:
+            budget.admission.release()
+        # Paced outside the admission lock: reads never queue behind the write budget.
+        if budget.writes and method in WRITE_METHODS:
+            await budget.writes.acquire(priority)
+
+    def observe(self, budget, r):
+        if "x-ratelimit-remaining" in r.headers:
+            budget.remaining = int(r.headers["x-ratelimit-remaining"])
+            budget.reset_at = float(r.headers.get("x-ratelimit-reset", 0))
+
+    async def run(self, token, method, call, priority=PRIORITY_DEPLOY):
+        """Send `call()` (returning an httpx response) once the token's budget allows,
+        retrying rate-limited answers after the pause GitHub asked for."""
+        budget = self.budget(token)
+        for attempt in range(self.retries + 1):
+            await self._admit(budget, method, priority)
+            async with self.in_flight:
+                r = await call()
+            self.observe(budget, r)
+            pause = _rate_limit_pause(r, budget)
+            if pause is None:
+                budget.strikes = 0
+                return r
+            if attempt == self.retries:
+                return r
+            budget.strikes += 1
+            budget.paused_until = max(budget.paused_until, time.time() + pause)
+            print(f"⏳ GitHub rate limited ({r.status_code}), pausing {pause:.0f}s (attempt {attempt + 1})")
+        return r
@@ -1,39 +1,202 @@
+import asyncio
 import os
-import subprocess
-import tempfile
 import time
-import requests
-from github import Github, GithubException
+from collections import deque
+import httpx
+from http_utils import request
+from helpers import git_blob_sha
+from repo_state import repo_state
+from artifacts import artifact_store
+from github_limits import GitHubScheduler, PRIORITY_DEPLOY, PRIORITY_NEW_REPO
+from token_pool import TokenPool, configured_tokens
+from metrics import timed, PAGES_READY_TOTAL
 
+# === CONFIG ===
+GITHUB_API = os.getenv("GITHUB_API_URL", "https://api.github.com")
+GITHUB_CACHE_TTL = float(os.getenv("GITHUB_CACHE_TTL", "300"))
+PAGES_READY_TIMEOUT = float(os.getenv("PAGES_READY_TIMEOUT", "600"))
+PAGES_POLL_MIN = float(os.getenv("PAGES_POLL_MIN", "2"))
+PAGES_POLL_MAX = float(os.getenv("PAGES_POLL_MAX", "30"))
 
-def create_and_push_repo(repo_name, files, evaluation_data=None):
-    """Create or reuse a GitHub repo, push files, enable Pages, and notify evaluation endpoint."""
-    token = os.getenv("GITHUB_TOKEN")
-    if not token:
-        raise RuntimeError("GITHUB_TOKEN not set")
+_pages_build_seconds = deque(maxlen=50)
 
-    # Authenticate user
-    user = Github(token).get_user()
-    print(f"🔐 Authenticated as: {user.login}")
 
-    # Try creating or reusing repo
-    try:
-        repo = user.create_repo(
-            repo_name,
-            description="Auto-generated repo for IITM LLM Deployment",
-            private=False,
-        )
-        print(f"✅ Created new repo: {repo.html_url}")
-    except GithubException as e:
-        if e.status == 422 and "name already exists" in str(e.data).lower():
-            repo = user.get_repo(repo_name)
-            print(f"♻️ Repo '{repo_name}' already exists — reusing it.")
-        else:
-            print(f"❌ Repo creation failed: {e.data}")
-            return None, None, None
+def github_headers(token):
+    return {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+
+
+_github_scheduler = GitHubScheduler()
+
+
+async def github_request(method, path, token, headers=None, priority=PRIORITY_DEPLOY, **kwargs):
+    """Call the GitHub REST API through the shared HTTP pool, paced by the rate-limit scheduler."""
+    headers = {**github_headers(token), **(headers or {})}
+    return await _github_scheduler.run(
+        token, method, lambda: request(method, f"{GITHUB_API}{path}", headers=headers, **kwargs), priority,
+    )
+
+
+class GitHubCache:
+    """Process-wide cache of GitHub GET responses, shared by every worker.
+
+    Entries are served without a request for `ttl` seconds, then revalidated
+    with If-None-Match; GitHub doesn't count 304 answers against the rate
+    limit. Concurrent lookups of the same resource share one request.
+    """
+
+    def __init__(self, ttl=GITHUB_CACHE_TTL):
+        self.ttl = ttl
+        self.entries = {}  # (token, path) -> [expires, etag, data]
+        self.locks = {}
+
+    def put(self, path, token, data, etag=None):
+        self.entries[(token, path)] = [time.monotonic() + self.ttl, etag, data]
+
+    def has(self, path, token):
+        return (token, path) in self.entries
+
+    def invalidate(self, path, token):
+        self.entries.pop((token, path), None)
+
+    async def get_json(self, path, token):
+        """GET `path` as JSON, or None on 404."""
+        key = (token, path)
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[2]
+            headers = {"If-None-Match": entry[1]} if entry and entry[1] else None
+            r = await github_request("GET", path, token, headers=headers)
+            if r.status_code == 304 and entry:
+                entry[0] = time.monotonic() + self.ttl
+                return entry[2]
+            if r.status_code == 404:
+                self.invalidate(path, token)
+                return None
+            r.raise_for_status()
+            data = r.json()
+            self.put(path, token, data, r.headers.get("etag"))
+            return data
+
+
+_github_cache = GitHubCache()
+_token_pool = TokenPool(configured_tokens(), quota=_github_scheduler.remaining)
+
+
+def repo_owner(repo_name):
+    """Login that `repo_name` was deployed under, or None if it hasn't been yet."""
+    return _token_pool.owner_of(repo_name)
+
+
+def tree_entries(files, known_blobs=None):
+    """Tree entries for `files`; paths in `known_blobs` ({path: blob sha}) reference the
+    blob GitHub already has instead of uploading the content again."""
+    known_blobs = known_blobs or {}
+    return [
+        {"path": name, "mode": "100644", "type": "blob", "sha": known_blobs[name]} if name in known_blobs
+        else {"path": name, "mode": "100644", "type": "blob", "content": content}
+        for name, content in files.items()
+    ]
+
+
+class StaleHead(Exception):
+    """main is no longer at the commit an incremental push was built on."""
+
+
+async def push_changes(owner, repo_name, files, token, parent, message="Automated deployment"):
+    """Commit `files` as a child of `parent` = (commit_sha, tree_sha, files at that commit),
+    uploading only the files that changed and moving main without force.
+
+    Returns (commit_sha, tree_sha); raises StaleHead if main moved or the base is gone.
+    """
+    base = f"/repos/{owner}/{repo_name}"
+    parent_sha, parent_tree, previous = parent
+    tree = tree_entries({name: content for name, content in files.items() if previous.get(name) != content})
+    tree += [{"path": name, "mode": "100644", "type": "blob", "sha": None} for name in previous if name not in files]
+    if not tree:
+        return parent_sha, parent_tree
+
+    r = await github_request("POST", f"{base}/git/trees", token, json={"base_tree": parent_tree, "tree": tree})
+    if r.status_code in (404, 422):
+        raise StaleHead(f"base tree {parent_tree[:7]} is gone")
+    r.raise_for_status()
+    tree_sha = r.json()["sha"]
+
+    r = await github_request("POST", f"{base}/git/commits", token, json={
+        "message": message,
+        "tree": tree_sha,
+        "parents": [parent_sha],
+        "author": {"name": owner, "email": f"{owner}@users.noreply.github.com"},
+    })
+    if r.status_code in (404, 422):
+        raise StaleHead(f"parent {parent_sha[:7]} is gone")
+    r.raise_for_status()
+    commit_sha = r.json()["sha"]
+
+    r = await github_request("PATCH", f"{base}/git/refs/heads/main", token, json={"sha": commit_sha, "force": False})
+    if r.status_code == 422:
+        raise StaleHead(f"main moved past {parent_sha[:7]}")
+    r.raise_for_status()
+    return commit_sha, tree_sha
+
+
+async def push_files(owner, repo_name, files, token, message="Automated deployment", known_blobs=None, parent=None):
+    """Commit `files` to `main` via the Git Data API and return (commit_sha, tree_sha).
+
+    With `parent` (see push_changes) only the delta is pushed on top of the
+    existing history; otherwise, or if main has moved since, `files` become
+    the full tree of a fresh root commit that main is forced to. Blobs are
+    created inline with the tree, so nothing is written to disk.
+    """
+    if parent:
+        try:
+            return await push_changes(owner, repo_name, files, token, parent, message)
+        except StaleHead as e:
+            print(f"⚠️ Incremental push to {repo_name} not possible ({e}) — pushing the full tree.")
 
-    # Prepare workflow for GitHub Pages
-    workflow_content = """name: Deploy Pages
+    base = f"/repos/{owner}/{repo_name}"
+    tree = tree_entries(files, known_blobs)
+
+    r = await github_request("POST", f"{base}/git/trees", token, json={"tree": tree})
+    if r.status_code == 422 and known_blobs:
+        # A blob we expected is gone (repo recreated outside the service); upload everything.
+        tree = tree_entries(files)
+        r = await github_request("POST", f"{base}/git/trees", token, json={"tree": tree})
+    if r.status_code == 409:
+        # The Git Data API refuses to work on an empty repository; seed it with one commit.
+        seed = await github_request("PUT", f"{base}/contents/.gitkeep", token, json={
+            "message": "Initialize repository", "content": "",
+        })
+        seed.raise_for_status()
+        r = await github_request("POST", f"{base}/git/trees", token, json={"tree": tree})
+    r.raise_for_status()
+    tree_sha = r.json()["sha"]
+
+    r = await github_request("POST", f"{base}/git/commits", token, json={
+        "message": message,
+        "tree": tree_sha,
+        "parents": [],
+        "author": {"name": owner, "email": f"{owner}@users.noreply.github.com"},
+    })
+    r.raise_for_status()
+    commit_sha = r.json()["sha"]
+
+    # Point main at the new commit, creating the branch if it doesn't exist yet.
+    r = await github_request("PATCH", f"{base}/git/refs/heads/main", token, json={"sha": commit_sha, "force": True})
+    if r.status_code == 422:
+        r = await github_request("POST", f"{base}/git/refs", token, json={"ref": "refs/heads/main", "sha": commit_sha})
+    r.raise_for_status()
+    return commit_sha, tree_sha
+
+
+# Workflow that publishes the repo root to GitHub Pages
+PAGES_WORKFLOW_PATH = ".github/workflows/pages.yml"
+PAGES_WORKFLOW = """name: Deploy Pages
 on:
   push:
     branches: [ main ]
@@ -63,90 +226,174 @@ jobs:
         id: deployment
         uses: actions/deploy-pages@v4
 """
-    files[".github/workflows/pages.yml"] = workflow_content
 
-    # --- Write files to temp dir and push ---
+
+async def get_authenticated_login(token):
+    user = await _github_cache.get_json("/user", token)
+    if user is None:
+        raise RuntimeError("GitHub token is not valid for /user")
+    return user["login"]
+
+
+async def get_or_create_repo(owner, repo_name, token):
+    """Create the repo, or fetch it if it already exists. Returns the repo JSON or None."""
+    path = f"/repos/{owner}/{repo_name}"
+    if _github_cache.has(path, token):
+        repo = await _github_cache.get_json(path, token)
+        if repo is not None:
+            return repo
+
+    r = await github_request("POST", "/user/repos", token, priority=PRIORITY_NEW_REPO, json={
+        "name": repo_name,
+        "description": "Auto-generated repo for IITM LLM Deployment",
+        "private": False,
+        "auto_init": True,
+    })
+    if r.status_code == 201:
+        repo = r.json()
+        _github_cache.put(path, token, repo)
+        await asyncio.to_thread(repo_state.forget, repo_name)
+        print(f"✅ Created new repo: {repo['html_url']}")
+        return repo
+    if r.status_code == 422 and "name already exists" in r.text.lower():
+        repo = await _github_cache.get_json(path, token)
+        if repo is None:
+            raise RuntimeError(f"Repo '{repo_name}' exists but cannot be read")
+        print(f"♻️ Repo '{repo_name}' already exists — reusing it.")
+        return repo
+    print(f"❌ Repo creation failed: {r.text}")
+    return None
+
+
+async def enable_pages(owner, repo_name, token):
+    """Enable GitHub Pages on main. Returns the Pages site JSON, or None if Pages is off."""
+    path = f"/repos/{owner}/{repo_name}/pages"
+    r = await github_request("POST", path, token, json={"source": {"branch": "main", "path": "/"}})
+    if r.status_code == 201:
+        print("✅ Pages enabled successfully")
+        return r.json()
+    if r.status_code != 409:
+        print(f"❌ Pages enablement failed ({r.status_code}) — {r.text}")
+        return None
+    r = await github_request("GET", path, token)
+    return r.json() if r.status_code == 200 else None
+
+
+async def latest_pages_build(owner, repo_name, token):
+    r = await github_request("GET", f"/repos/{owner}/{repo_name}/pages/builds/latest", token)
+    return r.json() if r.status_code == 200 else None
+
+
+async def site_serving(url):
+    try:
+        r = await request("GET", url, timeout=10)
+        return r.status_code == 200
+    except httpx.HTTPError:
+        return False
+
+
+def first_poll_delay():
+    """Most builds finish around the median of recent ones; don't poll much before that."""
+    if not _pages_build_seconds:
+        return PAGES_POLL_MIN
+    samples = sorted(_pages_build_seconds)
+    return min(PAGES_POLL_MAX, max(PAGES_POLL_MIN, 0.8 * samples[len(samples) // 2]))
+
+
+async def wait_for_pages(owner, repo_name, token, pages_url, commit_sha):
+    """Poll until the Pages build of `commit_sha` is done and `pages_url` answers 200,
+    backing off from the typical build time up to PAGES_POLL_MAX. Returns True when live."""
+    start = time.monotonic()
+    deadline = start + PAGES_READY_TIMEOUT
+    delay = first_poll_delay()
+    while (left := deadline - time.monotonic()) > 0:
+        await asyncio.sleep(min(delay, left))
+        delay = min(PAGES_POLL_MAX, delay * 1.5)
+        build = await latest_pages_build(owner, repo_name, token)
+        if not build or build.get("commit") not in (None, commit_sha):
+            continue
+        if build.get("status") == "errored":
+            print(f"❌ Pages build failed for {repo_name}: {(build.get('error') or {}).get('message')}")
+            PAGES_READY_TOTAL.labels("errored").inc()
+            return False
+        if build.get("status") == "built" and await site_serving(pages_url):
+            _pages_build_seconds.append(time.monotonic() - start)
+            PAGES_READY_TOTAL.labels("ready").inc()
+            return True
+    print(f"⚠️ Pages for {repo_name} not live after {PAGES_READY_TIMEOUT:.0f}s")
+    PAGES_READY_TOTAL.labels("timeout").inc()
+    return False
+
+
+async def create_and_push_repo(repo_name, files):
+    """Create or reuse a GitHub repo on a token from the pool, push files and enable Pages."""
+    tid = await asyncio.to_thread(_token_pool.pick, repo_name)
+    with _token_pool.lease(tid) as token:
+        try:
+            with timed("github_auth"):
+                user_login = await get_authenticated_login(token)
+        except (httpx.HTTPStatusError, RuntimeError) as e:
+            # Only an outright rejection benches the token; a 5xx blip is an ordinary failure.
+            rejected = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in (401, 403)
+            print(f"❌ GitHub token {tid[:8]} {'rejected' if rejected else 'could not authenticate'}: {e}")
+            _token_pool.report(tid, ok=False, fatal=rejected)
+            return None, None, None
+        print(f"🔐 Authenticated as: {user_login}")
+        result = await deploy_repo(user_login, repo_name, files, tid, token)
+    _token_pool.report(tid, ok=result[0] is not None)
+    return result
+
+
+async def deploy_repo(user_login, repo_name, files, tid, token):
+    # Create or reuse the repo
+    with timed("repo_create"):
+        repo = await get_or_create_repo(user_login, repo_name, token)
+    if repo is None:
+        return None, None, None
+    await asyncio.to_thread(_token_pool.assign, repo_name, tid, user_login)
+    state = await asyncio.to_thread(repo_state.get, repo_name)
+
+    # The workflow never changes; once a repo has its blob, reference it by SHA.
+    files[PAGES_WORKFLOW_PATH] = PAGES_WORKFLOW
+    workflow_sha = git_blob_sha(PAGES_WORKFLOW)
+    known_blobs = {PAGES_WORKFLOW_PATH: workflow_sha} if state.get("workflow_sha") == workflow_sha else None
+
+    # Build on the commit we deployed last time, if we know its files.
+    parent = None
+    if state.get("last_commit") and state.get("last_tree"):
+        previous = await asyncio.to_thread(artifact_store.files, repo_name, state["last_commit"])
+        if previous is not None:
+            parent = (state["last_commit"], state["last_tree"], previous)
+
+    # --- Commit files via the Git Data API ---
     try:
-        with tempfile.TemporaryDirectory() as tmp:
-            # Redirect HOME to prevent permission errors in Hugging Face
-            os.environ["HOME"] = tmp
-
-            # Write all generated files
-            for name, content in files.items():
-                file_path = os.path.join(tmp, name)
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(content)
-
-            subprocess.check_call(["git", "init"], cwd=tmp)
-
-            # Configure local git identity (sandbox safe)
-            user_login = user.login
-            user_email = f"{user_login}@users.noreply.github.com"
-            subprocess.check_call(["git", "config", "--local", "user.name", user_login], cwd=tmp)
-            subprocess.check_call(["git", "config", "--local", "user.email", user_email], cwd=tmp)
-            print(f"👤 Configured local git identity: {user_login} <{user_email}>")
-
-            # Commit + push
-            subprocess.check_call(["git", "add", "."], cwd=tmp)
-            subprocess.check_call(["git", "commit", "-m", "Automated deployment"], cwd=tmp)
-            subprocess.check_call(["git", "branch", "-M", "main"], cwd=tmp)
-
-            push_url = f"https://{token}@github.com/{user.login}/{repo_name}.git"
-            subprocess.check_call(["git", "remote", "add", "origin", push_url], cwd=tmp)
-            subprocess.check_call(["git", "push", "-u", "origin", "main", "--force"], cwd=tmp)
-
-            commit_sha = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=tmp).decode().strip()
-            print(f"✅ Successfully pushed commit {commit_sha} to {repo.html_url}")
-
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Git subprocess failed: {e}")
+        with timed("push"):
+            commit_sha, tree_sha = await push_files(
+                user_login, repo_name, files, token, known_blobs=known_blobs, parent=parent,
+            )
+        print(f"✅ Successfully pushed commit {commit_sha} to {repo['html_url']}")
+    except httpx.HTTPStatusError as e:
+        print(f"❌ Git Data API call failed: {e.response.status_code} {e.response.text}")
         return None, None, None
     except Exception as e:
         print(f"❌ Unexpected git push error: {e}")
         return None, None, None
 
-    # --- Enable GitHub Pages via API ---
-    pages_url = f"https://{user.login}.github.io/{repo_name}/"
-    api_url = f"https://api.github.com/repos/{user.login}/{repo_name}/pages"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/vnd.github+json",
-        "X-GitHub-Api-Version": "2022-11-28",
-    }
-
-    # Try POST (create) instead of PUT (update)
-    for attempt in range(3):
-        r = requests.post(api_url, headers=headers, json={"source": {"branch": "main", "path": "/"}}, timeout=15)
-        if r.status_code in (201, 204):
-            print(f"✅ Pages enabled successfully (attempt {attempt + 1})")
-            break
-        elif r.status_code == 409:
-            print(f"⚠️ Pages already exists (409) — continuing.")
-            break
-        else:
-            print(f"Attempt {attempt + 1}: Pages enablement failed ({r.status_code}) — {r.text}")
-            time.sleep(5)
+    # --- Enable GitHub Pages (once per repo) and wait for the site to go live ---
+    if state.get("pages_enabled"):
+        site = {"html_url": state["pages_url"]}
     else:
-        print("❌ Could not enable GitHub Pages after 3 attempts.")
-
-    # --- Notify evaluation server if applicable ---
-    if evaluation_data:
-        payload = {
-            "email": evaluation_data["email"],
-            "task": evaluation_data["task"],
-            "round": evaluation_data["round"],
-            "nonce": evaluation_data["nonce"],
-            "repo_url": repo.html_url if repo else "",
-            "commit_sha": commit_sha if repo else "",
-            "pages_url": pages_url,
-        }
-        try:
-            res = requests.post(evaluation_data["evaluation_url"], json=payload, timeout=10)
-            print(f"📨 Evaluation POST → {res.status_code}")
-        except Exception as e:
-            print(f"⚠️ Evaluation callback failed: {e}")
+        with timed("pages_enable"):
+            site = await enable_pages(user_login, repo_name, token)
+    pages_url = (site or {}).get("html_url") or f"https://{user_login}.github.io/{repo_name}/"
+    await asyncio.to_thread(
+        repo_state.update, repo_name, pages_enabled=site is not None,
+        pages_url=pages_url, workflow_sha=workflow_sha, last_commit=commit_sha, last_tree=tree_sha,
+    )
+    if site is not None:
+        with timed("pages_ready"):
+            await wait_for_pages(user_login, repo_name, token, pages_url, commit_sha)
 
-    print(f"✅ Repo ready: {repo.html_url}")
+    print(f"✅ Repo ready: {repo['html_url']}")
     print(f"🔗 Pages URL: {pages_url}")
-    return repo.html_url, commit_sha, pages_url
+    return repo["html_url"], commit_sha, pages_url
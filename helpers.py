@@ -17,3 +17,23 @@ def decode_data_uri(uri: str):
     b64 = m.group(2)
     data = base64.b64decode(b64)
     return data, mime
+
+
+def encode_cursor(created_at, row_id) -> str:
+    """Opaque keyset cursor for a (created_at, id) position."""
+    return base64.urlsafe_b64encode(f"{created_at}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor; raises ValueError on malformed input."""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return created_at, int(row_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def git_blob_sha(content: str) -> str:
+    """SHA Git assigns to a blob with this content."""
+    data = content.encode()
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
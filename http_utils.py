@@ -0,0 +1,50 @@
+import asyncio
+import os
+from urllib.parse import urlsplit
+import httpx
+
+# === CONFIG ===
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_MAX_PER_HOST = int(os.environ.get("HTTP_MAX_PER_HOST", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "15"))
+
+_client = None
+_host_slots = {}
+
+
+def get_http_client():
+    """Return the process-wide pooled client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=True,  # needs the httpx[http2] extra
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+
+def _host_slot(url):
+    host = urlsplit(str(url)).netloc
+    if host not in _host_slots:
+        _host_slots[host] = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+    return _host_slots[host]
+
+
+async def request(method, url, **kwargs):
+    """Send a request through the shared pool, capped at HTTP_MAX_PER_HOST in flight per host."""
+    async with _host_slot(url):
+        return await get_http_client().request(method, url, **kwargs)
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+import uuid
+from database import transaction
+
+# === CONFIG ===
+WORKER_POOL_SIZE = int(os.environ.get("WORKER_POOL_SIZE", "32"))
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "900"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1.0"))
+JOB_RETRY_BASE_DELAY = float(os.environ.get("JOB_RETRY_BASE_DELAY", "10"))
+JOB_RETRY_MAX_DELAY = float(os.environ.get("JOB_RETRY_MAX_DELAY", "300"))
+
+
+def retry_delay(attempts, base=JOB_RETRY_BASE_DELAY, cap=JOB_RETRY_MAX_DELAY):
+    """Exponential backoff with jitter before the next attempt of a failed job."""
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1)
+
+
+class JobQueue:
+    """Durable job queue stored in the `jobs` table, with leased claims.
+
+    A worker claims a job by taking a lease on it. If the worker dies, the lease
+    expires and the job is handed out again; a job whose handler raised is retried
+    after a backoff. Either way it gets at most JOB_MAX_ATTEMPTS attempts.
+    """
+
+    def __init__(self, db_path, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def init(self):
+        with transaction(self.db_path) as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY,
+                    nonce TEXT,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    next_attempt_at REAL,
+                    last_error TEXT,
+                    task_id INTEGER,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_lease ON jobs (status, lease_expires)")
+            cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_task ON jobs (task_id)")
+
+    def enqueue(self, nonce, payload, task_id=None, cur=None):
+        """Queue a job and return its id. At most one job exists per task_id.
+
+        Pass `cur` to enqueue inside the caller's transaction.
+        """
+        if cur is None:
+            with transaction(self.db_path) as cur:
+                return self.enqueue(nonce, payload, task_id, cur)
+        cur.execute(
+            "INSERT INTO jobs (nonce, payload, status, task_id) VALUES (?, ?, 'queued', ?) "
+            "ON CONFLICT (task_id) DO NOTHING RETURNING id",
+            (nonce, json.dumps(payload), task_id),
+        )
+        row = cur.fetchone()
+        if row is None:
+            cur.execute("SELECT id FROM jobs WHERE task_id=?", (task_id,))
+            row = cur.fetchone()
+        return row[0]
+
+    def find_by_task(self, task_id, cur=None):
+        """Return (job_id, status) of the job for a task, or None."""
+        if cur is None:
+            with transaction(self.db_path) as cur:
+                return self.find_by_task(task_id, cur)
+        cur.execute("SELECT id, status FROM jobs WHERE task_id=?", (task_id,))
+        return cur.fetchone()
+
+    def expire(self):
+        """Fail jobs whose lease expired on their last attempt. Returns their payloads."""
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                "UPDATE jobs SET status='failed', last_error='lease expired', lease_owner=NULL, lease_expires=NULL "
+                "WHERE status='running' AND lease_expires < ? AND attempts >= ? RETURNING payload",
+                (time.time(), self.max_attempts),
+            )
+            return [json.loads(row[0]) for row in cur.fetchall()]
+
+    def claim(self, worker_id):
+        """Lease the oldest runnable job. Returns (job_id, payload) or None."""
+        now = time.time()
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                """
+                UPDATE jobs SET status='running', lease_owner=?, lease_expires=?, attempts=attempts + 1
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE (status='queued' AND (next_attempt_at IS NULL OR next_attempt_at <= ?))
+                       OR (status='running' AND lease_expires < ? AND attempts < ?)
+                    ORDER BY id LIMIT 1
+                )
+                RETURNING id, payload
+                """,
+                (worker_id, now + self.lease_seconds, now, now, self.max_attempts),
+            )
+            row = cur.fetchone()
+        if not row:
+            return None
+        return row[0], json.loads(row[1])
+
+    def complete(self, job_id, worker_id):
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                "UPDATE jobs SET status='done', lease_owner=NULL, lease_expires=NULL WHERE id=? AND lease_owner=?",
+                (job_id, worker_id),
+            )
+
+    def fail(self, job_id, worker_id, error):
+        """Release a job after an error: requeue it after a backoff, or fail it for good once
+        out of attempts. Returns the new status, or None if we no longer held the lease."""
+        with transaction(self.db_path) as cur:
+            cur.execute("SELECT attempts FROM jobs WHERE id=? AND lease_owner=?", (job_id, worker_id))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            status = "failed" if row[0] >= self.max_attempts else "queued"
+            cur.execute(
+                """
+                UPDATE jobs SET status=?, last_error=?, next_attempt_at=?, lease_owner=NULL, lease_expires=NULL
+                WHERE id=? AND lease_owner=?
+                """,
+                (status, str(error), time.time() + retry_delay(row[0]), job_id, worker_id),
+            )
+        return status
+
+    def renew(self, job_id, worker_id):
+        """Extend our lease on a job still being worked on. Returns False if we lost it."""
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                "UPDATE jobs SET lease_expires=? WHERE id=? AND lease_owner=? AND status='running'",
+                (time.time() + self.lease_seconds, job_id, worker_id),
+            )
+            return cur.rowcount > 0
+
+    def release(self, job_id, worker_id):
+        """Return a claimed job to the queue without counting it as an attempt."""
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                "UPDATE jobs SET status='queued', attempts=attempts - 1, lease_owner=NULL, lease_expires=NULL "
+                "WHERE id=? AND lease_owner=?",
+                (job_id, worker_id),
+            )
+
+    def depth(self):
+        with transaction(self.db_path) as cur:
+            cur.execute("SELECT COUNT(*) FROM jobs WHERE status='queued'")
+            count = cur.fetchone()[0]
+        return count
+
+
+class WorkerPool:
+    """Pool of asyncio workers draining a JobQueue through `await handler(payload)`.
+
+    A handler that raises has its job retried by the queue; once the job is out of
+    attempts, `await on_give_up(payload, error)` is called.
+
+    Workers only hold a coroutine while a build is waiting on the network, so the
+    pool size can be in the hundreds without a thread per build.
+    """
+
+    def __init__(self, queue, handler, on_give_up=None, size=WORKER_POOL_SIZE, poll_interval=JOB_POLL_INTERVAL):
+        self.queue = queue
+        self.handler = handler
+        self.on_give_up = on_give_up
+        self.size = size
+        self.poll_interval = poll_interval
+        self._wakeup = None
+        self._tasks = []
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        for i in range(self.size):
+            worker_id = f"{os.getpid()}-{i}-{uuid.uuid4().hex[:6]}"
+            self._tasks.append(asyncio.create_task(self._run(worker_id), name=f"job-worker-{i}"))
+        print(f"👷 Started {self.size} job workers")
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle workers right away instead of waiting for the next poll."""
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _wait_for_work(self):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _heartbeat(self, job_id, worker_id):
+        """Keep renewing the lease while the handler runs, so long builds aren't handed out twice."""
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                if not await asyncio.to_thread(self.queue.renew, job_id, worker_id):
+                    print(f"⚠️ Lost the lease on job {job_id} ({worker_id})")
+                    return
+            except sqlite3.Error as e:
+                print(f"⚠️ Lease renewal failed for job {job_id}: {e}")
+
+    async def _give_up_expired(self):
+        """Jobs whose worker died on their last attempt get the same on_give_up as handler failures."""
+        for payload in await asyncio.to_thread(self.queue.expire):
+            print("❌ Job lease expired on its last attempt, giving up")
+            if self.on_give_up:
+                try:
+                    await self.on_give_up(payload, "lease expired")
+                except Exception as e:
+                    print(f"⚠️ on_give_up failed for an expired job: {e}")
+
+    async def _run(self, worker_id):
+        while True:
+            try:
+                await self._give_up_expired()
+                job = await asyncio.to_thread(self.queue.claim, worker_id)
+            except sqlite3.Error as e:
+                print(f"⚠️ Job claim failed ({worker_id}): {e}")
+                job = None
+            if not job:
+                await self._wait_for_work()
+                continue
+
+            job_id, payload = job
+            heartbeat = asyncio.create_task(self._heartbeat(job_id, worker_id))
+            try:
+                await self.handler(payload)
+                await asyncio.to_thread(self.queue.complete, job_id, worker_id)
+            except asyncio.CancelledError:
+                # Shutting down: hand the job straight back instead of waiting out the lease.
+                self.queue.release(job_id, worker_id)
+                raise
+            except Exception as e:
+                status = await asyncio.to_thread(self.queue.fail, job_id, worker_id, e)
+                print(f"❌ Job {job_id} failed ({'retrying' if status == 'queued' else 'giving up'}): {e}")
+                if status == "failed" and self.on_give_up:
+                    await self.on_give_up(payload, e)
+            finally:
+                heartbeat.cancel()
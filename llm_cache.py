@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import time
+from database import DB_PATH, transaction
+
+# === CONFIG ===
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def attachment_digest(attachment):
+    return hashlib.sha256((attachment.get("url") or "").encode()).hexdigest()
+
+
+def cache_key(model, temperature, system_prompt, user_prompt, attachments):
+    """Content address of a chat completion request."""
+    material = json.dumps({
+        "model": model,
+        "temperature": temperature,
+        "system": system_prompt,
+        "user": user_prompt,
+        "attachments": [attachment_digest(a) for a in attachments],
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class LLMCache:
+    """SQLite-backed LRU cache of completion texts, bounded by total size and TTL."""
+
+    def __init__(self, db_path=DB_PATH, ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = ttl > 0 and max_bytes > 0
+        if self.enabled:
+            self.init()
+
+    def init(self):
+        with transaction(self.db_path) as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                "UPDATE llm_cache SET last_used=? WHERE key=? AND created_at > ? RETURNING response",
+                (now, key, now - self.ttl),
+            )
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    def put(self, key, response):
+        if not self.enabled:
+            return
+        now = time.time()
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode()), now, now),
+            )
+            # Drop expired entries, then least recently used ones until under the size budget.
+            cur.execute("DELETE FROM llm_cache WHERE created_at <= ?", (now - self.ttl,))
+            cur.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS running FROM llm_cache
+                    ) WHERE running > ?
+                )
+                """,
+                (self.max_bytes,),
+            )
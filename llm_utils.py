@@ -1,20 +1,310 @@
-import os, requests
-from openai import OpenAI
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import deque
+import httpx
+import openai
+from openai import AsyncOpenAI
+from http_utils import request
+from llm_cache import LLMCache, cache_key
+from artifacts import artifact_store
+from patches import EDIT_FORMAT, SEARCH_MARKER, apply_patches, parse_patches
+from metrics import timed, LLM_CACHE_TOTAL, LLM_ABORTS_TOTAL, LLM_FALLBACKS_TOTAL, LLM_HEDGES_TOTAL, LLM_EDITS_TOTAL
+from rate_limit import LLMLimiter, LLM_EXPECTED_OUTPUT_TOKENS, LLM_MAX_CONCURRENCY, estimate_tokens
+
+# === CONFIG ===
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", str(LLM_MAX_CONCURRENCY)))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+GITHUB_RAW_URL = os.getenv("GITHUB_RAW_URL", "https://raw.githubusercontent.com")
+LLM_STREAM = os.getenv("LLM_STREAM", "1") == "1"
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "90"))
+LLM_MAX_OUTPUT_CHARS = int(os.getenv("LLM_MAX_OUTPUT_CHARS", "200000"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "2"))
+# Output that hasn't reached "<" or a code fence within this many characters is not HTML.
+LLM_HEAD_LIMIT = int(os.getenv("LLM_HEAD_LIMIT", "400"))
+# Model tiers, tried in order when the previous one errors or times out.
+LLM_MODELS = [m.strip() for m in os.getenv("LLM_MODELS", "gpt-4o-mini").split(",") if m.strip()]
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.25"))
+# Hedging: "off", "auto" (fire a second request after the observed p95 latency) or a delay in seconds.
+LLM_HEDGE = os.getenv("LLM_HEDGE", "off")
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Round 2: ask for SEARCH/REPLACE edits against the deployed index.html instead of a full rewrite.
+LLM_EDIT_MODE = os.getenv("LLM_EDIT_MODE", "1") == "1"
+LLM_EDIT_OUTPUT_TOKENS = int(os.getenv("LLM_EDIT_OUTPUT_TOKENS", "500"))
+
+_llm_client = None
+_llm_client_lock = threading.Lock()
+_llm_limiter = LLMLimiter()
+_llm_cache = LLMCache()
+_llm_latencies = deque(maxlen=200)
 
 
 def get_llm_client():
-    base_url = os.getenv("OPENAI_BASE_URL", "https://aipipe.org/openai/v1")
-    api_key = os.getenv("OPENAI_API_KEY") or os.getenv("AIPIPE_TOKEN")
-    return OpenAI(base_url=base_url, api_key=api_key)
+    """Return the process-wide LLM client, creating it (and its connection pool) on first use."""
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                base_url = os.getenv("OPENAI_BASE_URL", "https://aipipe.org/openai/v1")
+                api_key = os.getenv("OPENAI_API_KEY") or os.getenv("AIPIPE_TOKEN")
+                http_client = httpx.AsyncClient(
+                    timeout=LLM_TIMEOUT,
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                    ),
+                )
+                _llm_client = AsyncOpenAI(base_url=base_url, api_key=api_key, http_client=http_client)
+    return _llm_client
+
+
+async def close_llm_client():
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.close()
+        _llm_client = None
+
+
+class MalformedOutput(Exception):
+    """The model's output is not usable HTML; raised as early as it can be detected."""
+
+
+_TRAILING_FENCE = re.compile(r"\n?```[ \t]*$")
+
+
+class FenceStripper:
+    """Incrementally cleans streamed model output down to the HTML document.
+
+    Drops a leading code fence (and any chatter before it) and stops at the
+    matching closing fence, so trailing explanations are never waited for.
+    Raises MalformedOutput if the output doesn't look like HTML or grows
+    past `max_chars`.
+    """
+
+    def __init__(self, max_chars=LLM_MAX_OUTPUT_CHARS, head_limit=LLM_HEAD_LIMIT):
+        self.max_chars = max_chars
+        self.head_limit = head_limit
+        self.head = ""
+        self.started = False
+        self.fenced = False
+        self.done = False
+        self.pending = ""
+        self.parts = []
+        self.size = 0
+
+    def feed(self, text):
+        if self.done:
+            return
+        if self.started:
+            self._emit(text)
+            return
+        self.head += text
+        stripped = self.head.lstrip()
+        if stripped.startswith("<"):
+            self.started = True
+            self._emit(stripped)
+            return
+        fence = self.head.find("```")
+        if fence != -1:
+            newline = self.head.find("\n", fence)
+            if newline != -1:
+                self.started = self.fenced = True
+                self._emit(self.head[newline + 1:])
+            return
+        if len(stripped) > self.head_limit:
+            raise MalformedOutput("output does not start with HTML")
+
+    def _emit(self, text):
+        buf = self.pending + text
+        if self.fenced:
+            end = buf.find("```")
+            if end != -1:
+                self._append(buf[:end])
+                self.pending = ""
+                self.done = True
+                return
+            # Hold back a possible partial fence split across chunks.
+            self._append(buf[:-2])
+            self.pending = buf[-2:]
+        else:
+            self._append(buf)
+            self.pending = ""
+
+    def _append(self, text):
+        self.size += len(text)
+        if self.size > self.max_chars:
+            raise MalformedOutput(f"output exceeds {self.max_chars} characters")
+        self.parts.append(text)
+
+    def finish(self):
+        if not self.started:
+            raise MalformedOutput("output does not contain HTML")
+        html = ("".join(self.parts) + ("" if self.done else self.pending)).strip()
+        if not self.fenced:
+            # Unfenced output can still end with a stray closing fence.
+            html = _TRAILING_FENCE.sub("", html)
+        if not html:
+            raise MalformedOutput("empty output")
+        return html
+
+
+class PatchCollector:
+    """Collects streamed SEARCH/REPLACE blocks and applies them to `source` on finish().
+
+    Same interface as FenceStripper. Raises MalformedOutput if no block has
+    started within `head_limit` characters, if the output grows past
+    `max_chars`, or if a block doesn't apply cleanly.
+    """
+
+    def __init__(self, source, max_chars=LLM_MAX_OUTPUT_CHARS, head_limit=LLM_HEAD_LIMIT):
+        self.source = source
+        self.max_chars = max_chars
+        self.head_limit = head_limit
+        self.started = False
+        self.done = False
+        self.parts = []
+        self.size = 0
+
+    def feed(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size > self.max_chars:
+            raise MalformedOutput(f"output exceeds {self.max_chars} characters")
+        if not self.started:
+            head = "".join(self.parts)
+            self.started = SEARCH_MARKER in head
+            if not self.started and len(head.lstrip()) > self.head_limit:
+                raise MalformedOutput("output does not start with an edit block")
+
+    def finish(self):
+        try:
+            return apply_patches(self.source, parse_patches("".join(self.parts)))
+        except ValueError as e:
+            raise MalformedOutput(str(e)) from e
+
+
+def clean_html(text, collector=FenceStripper):
+    stripper = collector()
+    stripper.feed(text)
+    return stripper.finish()
+
+
+async def complete_html(client, model, temperature, messages, collector=FenceStripper):
+    """One chat completion, cleaned to HTML by `collector()` (a FenceStripper unless
+    editing). Streams when LLM_STREAM is on, aborting as soon as the output is
+    malformed, oversized or past LLM_DEADLINE."""
+    async with asyncio.timeout(LLM_DEADLINE):
+        if not LLM_STREAM:
+            response = await client.chat.completions.create(model=model, temperature=temperature, messages=messages)
+            return clean_html(response.choices[0].message.content or "", collector)
+
+        stripper = collector()
+        stream = await client.chat.completions.create(
+            model=model, temperature=temperature, messages=messages, stream=True,
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    stripper.feed(chunk.choices[0].delta.content)
+                    if stripper.done:
+                        break
+        finally:
+            await stream.close()
+        return stripper.finish()
+
+
+def hedge_delay():
+    """Seconds to wait before hedging, or None when hedging is off or there's no p95 yet."""
+    if LLM_HEDGE == "off":
+        return None
+    if LLM_HEDGE != "auto":
+        return float(LLM_HEDGE)
+    if len(_llm_latencies) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    samples = sorted(_llm_latencies)
+    return samples[int(0.95 * (len(samples) - 1))]
+
+
+async def generate_once(client, model, temperature, messages, collector=FenceStripper):
+    """One rate-limited, timed generation with `model`."""
+    async def call():
+        start = time.monotonic()
+        with timed("llm_generation"):
+            html = await complete_html(client, model, temperature, messages, collector)
+        _llm_latencies.append(time.monotonic() - start)
+        return html
+
+    expected = LLM_EDIT_OUTPUT_TOKENS if collector is not FenceStripper else LLM_EXPECTED_OUTPUT_TOKENS
+    return await _llm_limiter.run(estimate_tokens(messages, expected), call)
+
+
+async def generate_hedged(client, model, hedge_model, temperature, messages, collector=FenceStripper):
+    """Run generate_once; if it hasn't answered after hedge_delay(), race a second
+    request on `hedge_model` and return the first valid answer."""
+    delay = hedge_delay()
+    first = asyncio.create_task(generate_once(client, model, temperature, messages, collector))
+    if delay is None:
+        return await first
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    LLM_HEDGES_TOTAL.inc()
+    print(f"🪃 Hedging {model} after {delay:.1f}s with {hedge_model}")
+    second = asyncio.create_task(generate_once(client, hedge_model, temperature, messages, collector))
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                if t.exception() is None:
+                    return t.result()
+                error = t.exception()
+        raise error
+    finally:
+        for t in pending:
+            t.cancel()
+
+
+async def generate_html(client, temperature, messages, models=None, collector=FenceStripper):
+    """Generate HTML, retrying malformed or slow output up to LLM_MAX_ATTEMPTS times per
+    model tier and falling back to the next tier on API errors or exhausted attempts."""
+    models = models or LLM_MODELS
+    error = None
+    for tier, model in enumerate(models):
+        hedge_model = models[tier + 1] if tier + 1 < len(models) else model
+        for attempt in range(1, LLM_MAX_ATTEMPTS + 1):
+            try:
+                return await generate_hedged(client, model, hedge_model, temperature, messages, collector)
+            except (MalformedOutput, TimeoutError) as e:
+                reason = "deadline" if isinstance(e, TimeoutError) else "malformed"
+                LLM_ABORTS_TOTAL.labels(reason).inc()
+                print(f"⚠️ LLM attempt {attempt} on {model} aborted ({reason}): {e}")
+                error = e
+            except openai.APIError as e:
+                print(f"⚠️ LLM call on {model} failed: {e}")
+                error = e
+                break
+        if tier + 1 < len(models):
+            LLM_FALLBACKS_TOTAL.labels(model).inc()
+            print(f"↪️ Falling back from {model} to {models[tier + 1]}")
+    raise error
 
 
 def summarize_attachments(attachments):
     return "\n".join([f"- {a.get('name')}: {a.get('url')[:40]}..." for a in attachments]) if attachments else "No attachments."
 
 
-def get_existing_html(user, repo_name):
+async def get_existing_html(user, repo_name):
+    """Latest deployed index.html: from the local artifact store, else raw.githubusercontent.com."""
+    html = await asyncio.to_thread(artifact_store.file, repo_name, "index.html")
+    if html is not None:
+        return html
     try:
-        r = requests.get(f"https://raw.githubusercontent.com/{user}/{repo_name}/main/index.html", timeout=10)
+        r = await request("GET", f"{GITHUB_RAW_URL}/{user}/{repo_name}/main/index.html", timeout=10)
         if r.status_code == 200:
             return r.text
     except Exception:
@@ -22,43 +312,87 @@ def get_existing_html(user, repo_name):
     return ""
 
 
-def generate_files_from_brief(brief: str, attachments=None, round_number=1, user=None, repo_name=None):
+async def cached_html(key, generate):
+    """Return the cached HTML for `key`, or await generate() and cache the result."""
+    html = await asyncio.to_thread(_llm_cache.get, key)
+    if html is not None:
+        LLM_CACHE_TOTAL.labels("hit").inc()
+        print(f"⚡ LLM cache hit ({key[:12]})")
+        return html
+    LLM_CACHE_TOTAL.labels("miss").inc()
+    html = await generate()
+    await asyncio.to_thread(_llm_cache.put, key, html)
+    return html
+
+
+async def edit_html(client, brief, existing_html, attachments, attachment_summary):
+    """Apply a round-2 brief to the deployed page as SEARCH/REPLACE edits, so output
+    size (and latency) follows the size of the change rather than the page."""
+    system_prompt = (
+        "You are an autonomous web app editor for IITM’s LLM Code Deployment platform.\n"
+        "You are given the current index.html of a deployed app and a new brief. Make the smallest\n"
+        "changes that satisfy the brief. Attachments are provided as data URIs.\n\n"
+        + EDIT_FORMAT
+    )
+    user_prompt = f"""
+Round 2 Brief:
+{brief}
+
+Current index.html:
+{existing_html}
+
+Attachments:
+{attachment_summary}
+"""
+    key = cache_key(LLM_MODELS[0], LLM_TEMPERATURE, system_prompt, user_prompt, attachments)
+    return await cached_html(key, lambda: generate_html(client, LLM_TEMPERATURE, [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ], collector=lambda: PatchCollector(existing_html)))
+
+
+async def generate_files_from_brief(brief: str, attachments=None, round_number=1, user=None, repo_name=None):
     attachments = attachments or []
     client = get_llm_client()
     attachment_summary = summarize_attachments(attachments)
 
-    system_prompt = (
-        "You are an autonomous web app generator for IITM’s LLM Code Deployment platform.\n"
-        "Generate minimal HTML5+JS+CSS web apps for given briefs. Attachments are provided as data URIs.\n"
-        "Use them directly inside <script> or <img> tags as needed. Do not print markdown or code fences.\n"
-    )
+    existing_html = ""
+    if round_number == 2:
+        with timed("existing_html_fetch"):
+            existing_html = await get_existing_html(user, repo_name)
 
-    existing_html = get_existing_html(user, repo_name) if round_number == 2 else ""
-    user_prompt = f"""
+    html = None
+    if existing_html and LLM_EDIT_MODE:
+        try:
+            html = await edit_html(client, brief, existing_html, attachments, attachment_summary)
+            LLM_EDITS_TOTAL.labels("applied").inc()
+        except (MalformedOutput, TimeoutError, openai.APIError) as e:
+            LLM_EDITS_TOTAL.labels("fallback").inc()
+            print(f"↪️ Edit mode failed ({e}), regenerating the whole page")
+
+    if html is None:
+        system_prompt = (
+            "You are an autonomous web app generator for IITM’s LLM Code Deployment platform.\n"
+            "Generate minimal HTML5+JS+CSS web apps for given briefs. Attachments are provided as data URIs.\n"
+            "Use them directly inside <script> or <img> tags as needed. Do not print markdown or code fences.\n"
+        )
+        user_prompt = f"""
 Round {round_number} Brief:
 {brief}
 
 Existing HTML (if any):
-{existing_html[:2000]}
+{existing_html}
 
 Attachments:
 {attachment_summary}
 
 Return only HTML for index.html.
 """
-
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0.25,
-        messages=[
+        key = cache_key(LLM_MODELS[0], LLM_TEMPERATURE, system_prompt, user_prompt, attachments)
+        html = await cached_html(key, lambda: generate_html(client, LLM_TEMPERATURE, [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
-        ],
-    )
-
-    html = response.choices[0].message.content.strip()
-    if html.startswith("```"):
-        html = html.strip("`").replace("html", "").strip()
+        ]))
 
     return {
         "index.html": html,
@@ -1,50 +1,58 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from contextlib import asynccontextmanager
+import json
+from fastapi import FastAPI, HTTPException, Response, Header, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import os, sqlite3, time, requests
-from helpers import hash_secret
-from github_utils import create_and_push_repo
-from llm_utils import generate_files_from_brief
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+import os, asyncio, time
+from helpers import hash_secret, encode_cursor, decode_cursor
+from database import (
+    DB_PATH, TASK_COLUMNS, TaskStatus, transaction, init_db, set_task_status, query_tasks, iter_tasks,
+)
+from jobs import JobQueue, WorkerPool
+from outbox import Outbox, OutboxDispatcher
+from artifacts import artifact_store
+from http_utils import close_http_client
+from metrics import (
+    TASK_SECONDS, TASKS_TOTAL, SUBMISSIONS_TOTAL,
+    TASKS_IN_FLIGHT, JOB_QUEUE_DEPTH, OUTBOX_PENDING,
+)
+from github_utils import create_and_push_repo, repo_owner
+from llm_utils import generate_files_from_brief, close_llm_client
 
 # === CONFIG ===
 STORED_SECRET_HASH = os.environ.get("STORED_SECRET_HASH")
 OWNER_GITHUB = os.environ.get("GITHUB_USER")
-DB_PATH = os.environ.get("DB_PATH", "./tasks.db")
-
-# Ensure DB writable (Hugging Face-safe)
-try:
-    os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
-    with open(os.path.join(os.path.dirname(DB_PATH) or ".", ".db_write_test"), "w") as f:
-        f.write("")
-except (OSError, IOError):
-    DB_PATH = "/tmp/tasks.db"
-    os.makedirs("/tmp", exist_ok=True)
-
-app = FastAPI(title="IITM LLM Code Deployment API")
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY,
-            email TEXT,
-            task TEXT,
-            round INTEGER,
-            nonce TEXT,
-            secret_hash TEXT,
-            brief TEXT,
-            evaluation_url TEXT,
-            status TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-    conn.close()
+
 init_db()
 
+job_queue = JobQueue(DB_PATH)
+job_queue.init()
+outbox = Outbox(DB_PATH)
+outbox.init()
+JOB_QUEUE_DEPTH.set_function(job_queue.depth)
+OUTBOX_PENDING.set_function(outbox.pending_count)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    workers.start()
+    dispatcher.start()
+    yield
+    await workers.stop()
+    await dispatcher.stop()
+    await close_http_client()
+    await close_llm_client()
+
+app = FastAPI(title="IITM LLM Code Deployment API", lifespan=lifespan)
+
+# (nonce, round) -> {"job_id", "job_status"} for submissions accepted by this process and
+# not finished yet, so retry storms are answered without touching the database.
+inflight = {}
+
 
 class TaskRequest(BaseModel):
     email: str
@@ -58,27 +66,102 @@ class TaskRequest(BaseModel):
     attachments: list = []
 
 
-@app.post("/api-endpoint")
-async def receive_task(req: TaskRequest, background_tasks: BackgroundTasks):
+def check_secret(secret):
     if not STORED_SECRET_HASH:
         raise HTTPException(status_code=500, detail="Server secret not configured")
-    if hash_secret(req.secret) != STORED_SECRET_HASH:
+    if hash_secret(secret or "") != STORED_SECRET_HASH:
         raise HTTPException(status_code=403, detail="Invalid secret")
 
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO tasks (email, task, round, nonce, secret_hash, brief, evaluation_url, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-        (req.email, req.task, req.round, req.nonce, STORED_SECRET_HASH, req.brief, req.evaluation_url, "received"),
-    )
-    conn.commit()
-    conn.close()
 
-    background_tasks.add_task(process_task, req.dict())
-    return {"status": "accepted", "task": req.task, "round": req.round, "nonce": req.nonce}
+def record_submission(req):
+    """Insert the task and, if it has none yet, its job in one transaction.
+
+    Returns (created, task_status, job_id, job_status, enqueued).
+    """
+    with transaction(job_queue.db_path) as cur:
+        cur.execute(
+            "INSERT INTO tasks (email, task, round, nonce, secret_hash, brief, evaluation_url, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (nonce, round) DO NOTHING RETURNING id, status",
+            (req.email, req.task, req.round, req.nonce, STORED_SECRET_HASH, req.brief, req.evaluation_url, TaskStatus.RECEIVED),
+        )
+        row = cur.fetchone()
+        created = row is not None
+        if not created:
+            cur.execute("SELECT id, status FROM tasks WHERE nonce=? AND round=?", (req.nonce, req.round))
+            row = cur.fetchone()
+        task_id, task_status = row
+
+        job = job_queue.find_by_task(task_id, cur)
+        if job is not None:
+            return created, task_status, job[0], job[1], False
+        # New submission, or a task row left by an older build without its job.
+        job_id = job_queue.enqueue(req.nonce, req.dict(exclude={"secret"}), task_id=task_id, cur=cur)
+    return created, task_status, job_id, "queued", True
+
+
+@app.post("/api-endpoint")
+async def receive_task(req: TaskRequest):
+    check_secret(req.secret)
+
+    key = (req.nonce, req.round)
+    if key in inflight:
+        SUBMISSIONS_TOTAL.labels("duplicate").inc()
+        return {"status": "duplicate", "task": req.task, "round": req.round, "nonce": req.nonce, **inflight[key]}
+
+    created, task_status, job_id, job_status, enqueued = await asyncio.to_thread(record_submission, req)
+    if enqueued:
+        inflight[key] = {"job_id": job_id, "job_status": "queued"}
+        workers.notify()
+
+    SUBMISSIONS_TOTAL.labels("accepted" if created else "duplicate").inc()
+    if created:
+        return {"status": "accepted", "task": req.task, "round": req.round, "nonce": req.nonce, "job_id": job_id}
+    return {"status": "duplicate", "task": req.task, "round": req.round, "nonce": req.nonce,
+            "job_id": job_id, "job_status": job_status, "task_status": task_status}
 
 
-def process_task(data: dict):
+@app.get("/tasks")
+def list_tasks(
+    x_secret: str = Header(None),
+    email: str = None,
+    task: str = None,
+    status: TaskStatus = None,
+    round: int = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
+    """Task history, newest first, with keyset pagination.
+
+    Pass the returned `next_cursor` back as `cursor` for the next page.
+    `format=ndjson` streams every matching row instead of one page.
+    """
+    check_secret(x_secret)
+    filters = {"email": email, "task": task, "status": status, "round_number": round}
+    if cursor:
+        try:
+            filters["before"] = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if format == "ndjson":
+        def lines():
+            for row in iter_tasks(**filters):
+                yield json.dumps(dict(zip(TASK_COLUMNS, row))) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    rows = query_tasks(limit + 1, **filters)
+    page = [dict(zip(TASK_COLUMNS, row)) for row in rows[:limit]]
+    next_cursor = encode_cursor(page[-1]["created_at"], page[-1]["id"]) if len(rows) > limit else None
+    return {"tasks": page, "next_cursor": next_cursor}
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+async def process_task(data: dict):
     task = data["task"]
     nonce = data["nonce"]
     round_number = data.get("round", 1)
@@ -86,52 +169,58 @@ def process_task(data: dict):
     repo_name = f"{task}-{short}"
 
     print(f"Processing {task} (Round {round_number})")
+    if (nonce, round_number) in inflight:
+        inflight[(nonce, round_number)]["job_status"] = "running"
+    TASKS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    outcome = "failed"
 
     try:
-        files = generate_files_from_brief(
+        await asyncio.to_thread(set_task_status, nonce, round_number, TaskStatus.RUNNING)
+        files = await generate_files_from_brief(
             brief=data["brief"],
             attachments=data.get("attachments", []),
             round_number=round_number,
-            user=OWNER_GITHUB,
+            user=await asyncio.to_thread(repo_owner, repo_name) or OWNER_GITHUB,
             repo_name=repo_name,
         )
         files["LICENSE"] = get_mit_license_text()
 
-        repo_url, commit_sha, pages_url = create_and_push_repo(
-            repo_name, files,
-            evaluation_data={
-                "email": data["email"],
-                "task": task,
-                "round": round_number,
-                "nonce": nonce,
-                "evaluation_url": data.get("evaluation_url"),
-            },
-        )
+        repo_url, commit_sha, pages_url = await create_and_push_repo(repo_name, files)
+        if not repo_url:
+            raise RuntimeError("GitHub deployment failed")
+        await asyncio.to_thread(artifact_store.save, repo_name, commit_sha, files)
 
-        post_to_evaluation_url(data, repo_url, commit_sha, pages_url)
+        await asyncio.to_thread(queue_evaluation_callback, data, repo_url, commit_sha, pages_url)
 
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE tasks SET status=? WHERE nonce=?",
-            (f"completed: {task} round {round_number}", nonce),
-        )
-        conn.commit()
-        conn.close()
+        await asyncio.to_thread(set_task_status, nonce, round_number, TaskStatus.COMPLETED)
+        outcome = "completed"
         print(f"✅ Task {task} (round {round_number}) completed successfully")
         print(f"🔗 Pages URL: {pages_url}")
 
     except Exception as e:
+        # Back to RECEIVED while the job queue decides whether to retry; see task_given_up.
         print(f"❌ Process failed for {task} (round {round_number}): {e}")
-        conn = sqlite3.connect(DB_PATH)
-        cur = conn.cursor()
-        cur.execute("UPDATE tasks SET status=? WHERE nonce=?", (f"failed: {str(e)}", nonce))
-        conn.commit()
-        conn.close()
+        await asyncio.to_thread(set_task_status, nonce, round_number, TaskStatus.RECEIVED, str(e))
+        raise
+    finally:
+        inflight.pop((nonce, round_number), None)
+        TASKS_IN_FLIGHT.dec()
+        TASK_SECONDS.labels(outcome).observe(time.perf_counter() - start)
+        TASKS_TOTAL.labels(outcome).inc()
+
+
+async def task_given_up(data: dict, error):
+    """The job queue is out of attempts for this task."""
+    await asyncio.to_thread(set_task_status, data["nonce"], data.get("round", 1), TaskStatus.FAILED, str(error))
 
 
-def post_to_evaluation_url(data, repo_url, commit_sha, pages_url):
-    """POST to evaluation_url with exponential backoff (per IITM spec)."""
+workers = WorkerPool(job_queue, process_task, on_give_up=task_given_up)
+dispatcher = OutboxDispatcher(outbox)
+
+
+def queue_evaluation_callback(data, repo_url, commit_sha, pages_url):
+    """Write the evaluation_url callback to the outbox; the dispatcher delivers it with retries."""
     if not data.get("evaluation_url"):
         print("⚠️ No evaluation_url provided, skipping callback.")
         return
@@ -145,18 +234,8 @@ def post_to_evaluation_url(data, repo_url, commit_sha, pages_url):
         "commit_sha": commit_sha,
         "pages_url": pages_url,
     }
-
-    for delay in [1, 2, 4, 8]:
-        try:
-            res = requests.post(data["evaluation_url"], json=payload, timeout=10)
-            print(f"📨 Evaluation POST → {res.status_code}")
-            if res.status_code == 200:
-                print("✅ Evaluation server acknowledged successfully.")
-                return
-        except Exception as e:
-            print(f"⚠️ Evaluation POST failed (retrying in {delay}s): {e}")
-        time.sleep(delay)
-    print("❌ Could not reach evaluation_url after multiple retries.")
+    outbox.enqueue(data["nonce"], data["round"], data["evaluation_url"], payload)
+    dispatcher.notify()
 
 
 def get_mit_license_text():
@@ -0,0 +1,42 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "task_stage_seconds", "Wall-clock time spent in each pipeline stage.",
+    ["stage", "outcome"], buckets=STAGE_BUCKETS,
+)
+TASK_SECONDS = Histogram(
+    "task_duration_seconds", "End-to-end time of process_task.",
+    ["outcome"], buckets=STAGE_BUCKETS,
+)
+TASKS_TOTAL = Counter("tasks_total", "Tasks processed, by outcome.", ["outcome"])
+SUBMISSIONS_TOTAL = Counter("submissions_total", "Submissions received on /api-endpoint.", ["result"])
+LLM_CACHE_TOTAL = Counter("llm_cache_requests_total", "LLM response cache lookups.", ["result"])
+LLM_ABORTS_TOTAL = Counter("llm_aborted_generations_total", "LLM generations abandoned mid-stream.", ["reason"])
+LLM_FALLBACKS_TOTAL = Counter("llm_fallbacks_total", "Generations that fell back to the next model tier.", ["from_model"])
+LLM_HEDGES_TOTAL = Counter("llm_hedged_requests_total", "Hedge requests sent after the p95 delay.")
+LLM_EDITS_TOTAL = Counter("llm_edits_total", "Round-2 edit-mode generations, by result.", ["result"])
+GITHUB_RATE_LIMITED_TOTAL = Counter("github_rate_limited_total", "GitHub answers that hit a rate limit.", ["kind"])
+PAGES_READY_TOTAL = Counter("pages_ready_total", "Pages sites waited on after a push, by result.", ["result"])
+CALLBACKS_TOTAL = Counter("evaluation_callbacks_total", "Evaluation callback delivery attempts.", ["result"])
+
+TASKS_IN_FLIGHT = Gauge("tasks_in_flight", "Tasks currently being processed.")
+JOB_QUEUE_DEPTH = Gauge("job_queue_depth", "Jobs waiting to be claimed.")
+OUTBOX_PENDING = Gauge("outbox_pending", "Evaluation callbacks waiting to be delivered.")
+
+
+@contextmanager
+def timed(stage):
+    """Observe the duration of the enclosed block under `stage`, labelled ok/error."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage, outcome).observe(time.perf_counter() - start)
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+from urllib.parse import urlsplit
+from database import transaction
+from http_utils import request
+from metrics import timed, CALLBACKS_TOTAL
+
+# === CONFIG ===
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "12"))
+OUTBOX_BASE_DELAY = float(os.environ.get("OUTBOX_BASE_DELAY", "1"))
+OUTBOX_MAX_DELAY = float(os.environ.get("OUTBOX_MAX_DELAY", "600"))
+OUTBOX_MAX_PER_HOST = int(os.environ.get("OUTBOX_MAX_PER_HOST", "8"))
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_SEND_TIMEOUT = float(os.environ.get("OUTBOX_SEND_TIMEOUT", "10"))
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", "1.0"))
+OUTBOX_LEASE_SECONDS = float(os.environ.get("OUTBOX_LEASE_SECONDS", "300"))
+
+
+def backoff_delay(attempts, base=OUTBOX_BASE_DELAY, cap=OUTBOX_MAX_DELAY):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * 2 ** attempts))
+
+
+class Outbox:
+    """Durable queue of evaluation callbacks stored in the `outbox` table."""
+
+    def __init__(self, db_path, max_attempts=OUTBOX_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+
+    def init(self):
+        with transaction(self.db_path) as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY,
+                    nonce TEXT,
+                    round INTEGER,
+                    url TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    delivered_at DATETIME
+                )
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)")
+            cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_nonce_round ON outbox (nonce, round)")
+
+    def enqueue(self, nonce, round_number, url, payload):
+        """Record the callback for (nonce, round). There is one delivery record per submission:
+        a rebuild refreshes an undelivered record (pending, backing off or dead) and sends it
+        again right away with a fresh attempt budget; a delivered one is never re-sent.
+        """
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                """
+                INSERT INTO outbox (nonce, round, url, payload, next_attempt_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (nonce, round) DO UPDATE SET
+                    url=excluded.url, payload=excluded.payload, status='pending', attempts=0,
+                    next_attempt_at=excluded.next_attempt_at, last_error=NULL
+                WHERE outbox.status != 'delivered'
+                """,
+                (nonce, round_number, url, json.dumps(payload), time.time()),
+            )
+
+    def claim_due(self, limit=OUTBOX_BATCH_SIZE, lease=OUTBOX_LEASE_SECONDS):
+        """Take due messages, pushing their next attempt out by `lease` in case we die mid-send."""
+        now = time.time()
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                """
+                UPDATE outbox SET next_attempt_at=?, attempts=attempts + 1
+                WHERE id IN (
+                    SELECT id FROM outbox WHERE status='pending' AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at LIMIT ?
+                )
+                RETURNING id, url, payload, attempts
+                """,
+                (now + lease, now, limit),
+            )
+            rows = cur.fetchall()
+        return [(row[0], row[1], json.loads(row[2]), row[3]) for row in rows]
+
+    def mark_delivered(self, message_id):
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                "UPDATE outbox SET status='delivered', delivered_at=CURRENT_TIMESTAMP, last_error=NULL WHERE id=?",
+                (message_id,),
+            )
+
+    def mark_failed(self, message_id, attempts, error):
+        """Schedule a retry with backoff, or give up once out of attempts."""
+        status = "dead" if attempts >= self.max_attempts else "pending"
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                "UPDATE outbox SET status=?, next_attempt_at=?, last_error=? WHERE id=?",
+                (status, time.time() + backoff_delay(attempts), str(error), message_id),
+            )
+        return status
+
+    def pending_count(self):
+        with transaction(self.db_path) as cur:
+            cur.execute("SELECT COUNT(*) FROM outbox WHERE status='pending'")
+            count = cur.fetchone()[0]
+        return count
+
+
+class OutboxDispatcher:
+    """Background task that delivers outbox messages, at most OUTBOX_MAX_PER_HOST at once per host.
+
+    Undelivered messages stay in the table, so delivery resumes after a restart.
+    """
+
+    def __init__(self, outbox, poll_interval=OUTBOX_POLL_INTERVAL):
+        self.outbox = outbox
+        self.poll_interval = poll_interval
+        self._host_slots = {}
+        self._sending = set()
+        self._wakeup = None
+        self._task = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="outbox-dispatcher")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._sending, return_exceptions=True)
+            self._task = None
+
+    def notify(self):
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(OUTBOX_MAX_PER_HOST)
+        return self._host_slots[host]
+
+    async def _run(self):
+        while True:
+            capacity = OUTBOX_BATCH_SIZE - len(self._sending)
+            messages = []
+            if capacity > 0:
+                try:
+                    messages = await asyncio.to_thread(self.outbox.claim_due, capacity)
+                except sqlite3.Error as e:
+                    print(f"⚠️ Outbox claim failed: {e}")
+            for message in messages:
+                t = asyncio.create_task(self._deliver(*message))
+                self._sending.add(t)
+                t.add_done_callback(self._sending.discard)
+            if len(messages) < capacity or capacity <= 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _deliver(self, message_id, url, payload, attempts):
+        async with self._host_slot(url):
+            try:
+                with timed("callback"):
+                    res = await request("POST", url, json=payload, timeout=OUTBOX_SEND_TIMEOUT)
+                print(f"📨 Evaluation POST → {res.status_code}")
+                if res.status_code == 200:
+                    CALLBACKS_TOTAL.labels("delivered").inc()
+                    await asyncio.to_thread(self.outbox.mark_delivered, message_id)
+                    print("✅ Evaluation server acknowledged successfully.")
+                    return
+                error = f"HTTP {res.status_code}"
+            except Exception as e:
+                error = e
+        CALLBACKS_TOTAL.labels("failed").inc()
+        status = await asyncio.to_thread(self.outbox.mark_failed, message_id, attempts, error)
+        if status == "dead":
+            print(f"❌ Giving up on evaluation callback {message_id} after {attempts} attempts: {error}")
+        else:
+            print(f"⚠️ Evaluation POST failed (attempt {attempts}), will retry: {error}")
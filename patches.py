@@ -0,0 +1,57 @@
+import re
+
+SEARCH_MARKER = "<<<<<<< SEARCH"
+DIVIDER = "======="
+REPLACE_MARKER = ">>>>>>> REPLACE"
+
+_BLOCK_RE = re.compile(
+    r"^<{7} SEARCH[ \t]*\n(.*?)^={7}[ \t]*\n(.*?)^>{7} REPLACE[ \t]*$",
+    re.MULTILINE | re.DOTALL,
+)
+
+EDIT_FORMAT = f"""Reply only with one or more edit blocks in exactly this format:
+
+{SEARCH_MARKER}
+lines copied exactly from the current file
+{DIVIDER}
+the lines that replace them
+{REPLACE_MARKER}
+
+Each SEARCH section must match the current file exactly and be long enough to be unique.
+Do not return the whole file, and do not add explanations."""
+
+
+def parse_patches(text):
+    """Return [(search, replace), ...] from SEARCH/REPLACE blocks; raises ValueError if there are none."""
+    blocks = [(m.group(1), m.group(2)) for m in _BLOCK_RE.finditer(text)]
+    if not blocks:
+        raise ValueError("no SEARCH/REPLACE blocks in output")
+    return blocks
+
+
+def _find_loose(source, search):
+    """Locate `search` ignoring trailing whitespace on each line. Returns (start, end) or None."""
+    lines = source.splitlines(keepends=True)
+    wanted = [line.rstrip() for line in search.splitlines()]
+    for i in range(len(lines) - len(wanted) + 1):
+        if all(lines[i + j].rstrip() == wanted[j] for j in range(len(wanted))):
+            start = sum(len(line) for line in lines[:i])
+            return start, start + sum(len(line) for line in lines[i:i + len(wanted)])
+    return None
+
+
+def apply_patches(source, blocks):
+    """Apply (search, replace) blocks in order; raises ValueError if a SEARCH isn't found."""
+    for search, replace in blocks:
+        if not search.strip():
+            raise ValueError("empty SEARCH section")
+        start = source.find(search)
+        if start != -1:
+            end = start + len(search)
+        else:
+            span = _find_loose(source, search)
+            if span is None:
+                raise ValueError(f"SEARCH section not found: {search[:80]!r}")
+            start, end = span
+        source = source[:start] + replace + source[end:]
+    return source
@@ -0,0 +1,96 @@
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+import openai
+
+# === CONFIG ===
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))  # requests per minute, 0 = unlimited
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))  # tokens per minute, 0 = unlimited
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "5"))
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "2000"))
+
+
+def estimate_tokens(messages, expected_output=LLM_EXPECTED_OUTPUT_TOKENS):
+    """Rough token cost of a request: ~4 characters per prompt token plus the expected completion."""
+    return sum(len(m.get("content") or "") for m in messages) // 4 + expected_output
+
+
+def retry_after_seconds(error):
+    """Delay requested by a 429 response, or None if it didn't say."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at `per_minute` units per minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount):
+        amount = min(amount, self.capacity)
+        # The lock makes waiters queue up in order instead of starving large requests.
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class LLMLimiter:
+    """Shared admission control for LLM calls: in-flight cap, RPM and TPM budgets,
+    and a process-wide pause whenever the provider answers 429.
+    """
+
+    def __init__(self, max_in_flight=LLM_MAX_CONCURRENCY, rpm=LLM_RPM, tpm=LLM_TPM,
+                 retries=LLM_RATE_LIMIT_RETRIES):
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.retries = retries
+        self.paused_until = 0.0
+
+    def pause_for(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens):
+        while (delay := self.paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+        if self.requests:
+            await self.requests.acquire(1)
+        if self.tokens:
+            await self.tokens.acquire(estimated_tokens)
+        async with self.in_flight:
+            yield
+
+    async def run(self, estimated_tokens, call):
+        """Await `call()` inside a slot, retrying 429s after the provider's Retry-After."""
+        for attempt in range(self.retries + 1):
+            async with self.slot(estimated_tokens):
+                try:
+                    return await call()
+                except openai.RateLimitError as e:
+                    if attempt == self.retries:
+                        raise
+                    delay = retry_after_seconds(e) or min(60, 2 ** attempt) * random.uniform(0.5, 1.5)
+                    print(f"⏳ LLM rate limited, pausing {delay:.1f}s (attempt {attempt + 1})")
+                    self.pause_for(delay)
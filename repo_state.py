@@ -0,0 +1,57 @@
+from database import DB_PATH, transaction
+
+REPO_STATE_FIELDS = ("pages_enabled", "pages_url", "workflow_sha", "last_commit", "last_tree")
+
+
+class RepoStateStore:
+    """What we already set up on each GitHub repo, so repeat deployments can skip it:
+    whether Pages is enabled (and its URL), the blob SHA of the Pages workflow we
+    pushed, and the last commit (and its tree) we deployed. The repo's owner lives
+    in `repo_owners` (see TokenPool.assignment).
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.init()
+
+    def init(self):
+        with transaction(self.db_path) as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS repo_state (
+                    repo TEXT PRIMARY KEY,
+                    pages_enabled INTEGER NOT NULL DEFAULT 0,
+                    pages_url TEXT,
+                    workflow_sha TEXT,
+                    last_commit TEXT,
+                    last_tree TEXT,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+    def get(self, repo):
+        """Return the state of `repo` as a dict, or {} if we have never deployed it."""
+        with transaction(self.db_path) as cur:
+            cur.execute(f"SELECT {', '.join(REPO_STATE_FIELDS)} FROM repo_state WHERE repo=?", (repo,))
+            row = cur.fetchone()
+        return dict(zip(REPO_STATE_FIELDS, row)) if row else {}
+
+    def update(self, repo, **fields):
+        unknown = set(fields) - set(REPO_STATE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown repo state fields: {sorted(unknown)}")
+        columns = ", ".join(fields)
+        updates = ", ".join(f"{c}=excluded.{c}" for c in fields)
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                f"INSERT INTO repo_state (repo, {columns}) VALUES (?{', ?' * len(fields)}) "
+                f"ON CONFLICT (repo) DO UPDATE SET {updates}, updated_at=CURRENT_TIMESTAMP",
+                (repo, *fields.values()),
+            )
+
+    def forget(self, repo):
+        """Drop the state of `repo`, e.g. because it was just (re)created empty."""
+        with transaction(self.db_path) as cur:
+            cur.execute("DELETE FROM repo_state WHERE repo=?", (repo,))
+
+
+repo_state = RepoStateStore()
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Modules open their SQLite stores at import time; keep them out of the working tree.
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="tests-"), "tasks.db"))
@@ -0,0 +1,55 @@
+import pytest
+from llm_utils import FenceStripper, MalformedOutput, clean_html
+
+HTML = "<!DOCTYPE html>\n<html><body><p>hi</p></body></html>"
+
+
+def stream(text, chunk=5):
+    stripper = FenceStripper()
+    for i in range(0, len(text), chunk):
+        stripper.feed(text[i:i + chunk])
+        if stripper.done:
+            break
+    return stripper.finish()
+
+
+def test_plain_html_passes_through():
+    assert clean_html(f"  {HTML}\n") == HTML
+
+
+def test_fenced_output_drops_chatter_and_fences():
+    assert stream(f"Here you go:\n```html\n{HTML}\n```\nHope this helps!") == HTML
+
+
+def test_closing_fence_split_across_chunks():
+    for chunk in range(1, 8):
+        assert stream(f"```html\n{HTML}\n```", chunk) == HTML
+
+
+def test_unfenced_output_with_trailing_fence():
+    assert clean_html("<p>x</p>\n```") == "<p>x</p>"
+    assert clean_html("<p>x</p>```") == "<p>x</p>"
+
+
+def test_backticks_inside_html_are_kept():
+    html = "<pre>```js\nx()\n```</pre>"
+    assert clean_html(html) == html
+
+
+def test_non_html_is_rejected_early():
+    stripper = FenceStripper(head_limit=20)
+    with pytest.raises(MalformedOutput):
+        stripper.feed("I'm sorry, but I can't help with that request.")
+
+
+def test_oversized_output_is_rejected():
+    stripper = FenceStripper(max_chars=10)
+    with pytest.raises(MalformedOutput):
+        stripper.feed(HTML)
+
+
+def test_empty_or_missing_html_is_rejected():
+    with pytest.raises(MalformedOutput):
+        clean_html("```html\n```")
+    with pytest.raises(MalformedOutput):
+        FenceStripper().finish()
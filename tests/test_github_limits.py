@@ -0,0 +1,50 @@
+import asyncio
+from github_limits import PriorityLock, PriorityTokenBucket
+
+
+def test_priority_lock_wakes_lowest_priority_first():
+    async def scenario():
+        lock = PriorityLock()
+        order = []
+        await lock.acquire(0)
+
+        async def waiter(name, priority):
+            await lock.acquire(priority)
+            order.append(name)
+            lock.release()
+
+        tasks = [asyncio.create_task(waiter("new", 1)), asyncio.create_task(waiter("deploy", 0))]
+        await asyncio.sleep(0)
+        lock.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["deploy", "new"]
+
+
+def test_bucket_serves_late_high_priority_waiter_first():
+    async def scenario():
+        bucket = PriorityTokenBucket(per_minute=600)  # one token every 0.1s
+        bucket.tokens = 0
+        order = []
+
+        async def waiter(name, priority):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        tasks = [asyncio.create_task(waiter(f"new{i}", 1)) for i in range(2)]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.create_task(waiter("deploy", 0)))
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["deploy", "new0", "new1"]
+
+
+def test_bucket_does_not_block_when_tokens_are_available():
+    async def scenario():
+        bucket = PriorityTokenBucket(per_minute=60)
+        await asyncio.wait_for(asyncio.gather(*(bucket.acquire(1) for _ in range(60))), 0.1)
+        return bucket.tokens
+
+    assert asyncio.run(scenario()) < 1
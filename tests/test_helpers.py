@@ -0,0 +1,22 @@
+import pytest
+from helpers import decode_cursor, encode_cursor, git_blob_sha
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor("2025-10-18 12:00:00", 42)
+    assert decode_cursor(cursor) == ("2025-10-18 12:00:00", 42)
+
+
+def test_cursor_keeps_pipes_in_timestamp():
+    assert decode_cursor(encode_cursor("a|b", 7)) == ("a|b", 7)
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", encode_cursor("x", 1)[:-4] + "AAAA", "eHl6"])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_git_blob_sha_matches_git():
+    # `printf 'hello\n' | git hash-object --stdin`
+    assert git_blob_sha("hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
@@ -0,0 +1,63 @@
+import asyncio
+import time
+import pytest
+from jobs import JobQueue, WorkerPool
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(str(tmp_path / "jobs.db"), lease_seconds=0.3)
+    q.init()
+    return q
+
+
+def test_renew_only_extends_a_lease_we_hold(queue):
+    job_id = queue.enqueue("n1", {"nonce": "n1"})
+    assert queue.claim("w1") == (job_id, {"nonce": "n1"})
+    assert queue.renew(job_id, "w1")
+    assert not queue.renew(job_id, "w2")
+    queue.complete(job_id, "w1")
+    assert not queue.renew(job_id, "w1")
+
+
+def test_heartbeat_keeps_a_long_job_from_being_reclaimed(queue):
+    queue.enqueue("n1", {"nonce": "n1"})
+    reclaimed = []
+
+    async def slow_handler(payload):
+        for _ in range(4):
+            await asyncio.sleep(0.25)  # well past the 0.3s lease in total
+            reclaimed.append(queue.claim("intruder"))
+
+    async def scenario():
+        pool = WorkerPool(queue, slow_handler, size=1, poll_interval=0.01)
+        pool.start()
+        await asyncio.sleep(1.2)
+        await pool.stop()
+
+    asyncio.run(scenario())
+    assert reclaimed and all(job is None for job in reclaimed)
+
+
+def test_lease_expiring_on_last_attempt_gives_up_through_on_give_up(queue):
+    queue.enqueue("n1", {"nonce": "n1"})
+    for attempt in range(queue.max_attempts):
+        assert queue.claim(f"dead-{attempt}") is not None
+        time.sleep(queue.lease_seconds + 0.05)
+    given_up = []
+
+    async def handler(payload):
+        raise AssertionError("an exhausted job must not run again")
+
+    async def on_give_up(payload, error):
+        given_up.append((payload, str(error)))
+
+    async def scenario():
+        pool = WorkerPool(queue, handler, on_give_up=on_give_up, size=2, poll_interval=0.01)
+        pool.start()
+        await asyncio.sleep(0.1)
+        await pool.stop()
+
+    asyncio.run(scenario())
+    assert given_up == [({"nonce": "n1"}, "lease expired")]
+    assert queue.claim("w1") is None
@@ -0,0 +1,70 @@
+import sqlite3
+import threading
+import pytest
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = str(tmp_path / "tasks.db")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    return path
+
+
+def user_version(path):
+    return sqlite3.connect(path).execute("PRAGMA user_version").fetchone()[0]
+
+
+def test_fresh_database_gets_every_migration(db):
+    database.init_db()
+    assert user_version(db) == len(database.MIGRATIONS)
+    database.init_db()  # idempotent
+    assert user_version(db) == len(database.MIGRATIONS)
+
+
+def test_legacy_rows_are_deduplicated_and_normalised(db):
+    conn = sqlite3.connect(db)
+    for sql in database.MIGRATIONS[0]:
+        conn.execute(sql)
+    conn.executemany(
+        "INSERT INTO tasks (nonce, round, status) VALUES (?, ?, ?)",
+        [("a", 1, "received"), ("a", 1, "failed: duplicate"), ("b", 1, "failed: boom"),
+         ("c", 1, "completed ✅"), ("d", 1, None)],
+    )
+    conn.commit()
+    conn.close()
+
+    database.init_db()
+    with database.transaction() as cur:
+        cur.execute("SELECT nonce, status, error FROM tasks ORDER BY nonce")
+        rows = cur.fetchall()
+    assert rows == [("a", "received", None), ("b", "failed", "boom"), ("c", "completed", None), ("d", "received", None)]
+
+
+def test_invalid_status_is_rejected(db):
+    database.init_db()
+    with pytest.raises(sqlite3.IntegrityError):
+        with database.transaction() as cur:
+            cur.execute("INSERT INTO tasks (nonce, round, status) VALUES ('x', 1, 'done')")
+    with pytest.raises(sqlite3.IntegrityError):
+        with database.transaction() as cur:
+            cur.execute("INSERT INTO tasks (nonce, round, status) VALUES ('x', 1, 'received')")
+            cur.execute("INSERT INTO tasks (nonce, round, status) VALUES ('x', 1, 'received')")
+
+
+def test_concurrent_startups_apply_each_migration_once(db, monkeypatch):
+    # Another process migrates the database between our version read and our first BEGIN IMMEDIATE.
+    raced = []
+
+    class MigratedMeanwhile(list):
+        def __getitem__(self, index):
+            if isinstance(index, slice) and not raced:
+                raced.append(True)
+                other = threading.Thread(target=database.init_db)
+                other.start()
+                other.join()
+            return super().__getitem__(index)
+
+    monkeypatch.setattr(database, "MIGRATIONS", MigratedMeanwhile(database.MIGRATIONS))
+    database.init_db()  # used to fail with "duplicate column name: error"
+    assert raced and user_version(db) == len(database.MIGRATIONS)
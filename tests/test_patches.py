@@ -0,0 +1,43 @@
+import pytest
+from patches import apply_patches, parse_patches
+
+SOURCE = "<html>\n<body>\n  <h1>Hi</h1>  \n  <p>old</p>\n</body>\n</html>\n"
+
+
+def block(search, replace):
+    return f"<<<<<<< SEARCH\n{search}=======\n{replace}>>>>>>> REPLACE\n"
+
+
+def test_parse_multiple_blocks_inside_a_fence():
+    text = "```\n" + block("a\n", "b\n") + block("c\n", "") + "```"
+    assert parse_patches(text) == [("a\n", "b\n"), ("c\n", "")]
+
+
+def test_parse_without_blocks_fails():
+    with pytest.raises(ValueError):
+        parse_patches("<html></html>")
+
+
+def test_exact_match_is_replaced():
+    out = apply_patches(SOURCE, [("  <p>old</p>\n", "  <p>new</p>\n")])
+    assert "<p>new</p>" in out and "<p>old</p>" not in out
+
+
+def test_blocks_apply_in_order():
+    out = apply_patches(SOURCE, [("<p>old</p>", "<p>mid</p>"), ("<p>mid</p>", "<p>new</p>")])
+    assert "<p>new</p>" in out
+
+
+def test_trailing_whitespace_is_ignored_when_matching():
+    out = apply_patches(SOURCE, [("  <h1>Hi</h1>\n", "  <h1>Hello</h1>\n")])
+    assert out == SOURCE.replace("  <h1>Hi</h1>  \n", "  <h1>Hello</h1>\n")
+
+
+def test_missing_search_fails():
+    with pytest.raises(ValueError):
+        apply_patches(SOURCE, [("<p>absent</p>\n", "x\n")])
+
+
+def test_empty_search_fails():
+    with pytest.raises(ValueError):
+        apply_patches(SOURCE, [("\n", "x\n")])
@@ -0,0 +1,23 @@
+import pytest
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "tasks.db"))
+    database.init_db()
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"status": "completed"},
+    {"email": "a@example.com"},
+    {"task": "captcha-solver"},
+    {"status": "completed", "before": ("2025-10-18 12:00:00", 42)},
+])
+def test_task_pages_are_read_in_index_order(db, filters):
+    sql, params = database._task_query(**filters)
+    with database.transaction() as cur:
+        cur.execute(f"EXPLAIN QUERY PLAN {sql} LIMIT 50", params)
+        plan = " ".join(row[3] for row in cur.fetchall())
+    assert "TEMP B-TREE" not in plan, plan
@@ -0,0 +1,24 @@
+import asyncio
+import httpx
+import pytest
+import github_utils
+from token_pool import TokenPool, token_id
+
+
+def auth_error(status):
+    request = httpx.Request("GET", "https://api.github.com/user")
+    response = httpx.Response(status, request=request)
+    return httpx.HTTPStatusError(f"{status}", request=request, response=response)
+
+
+@pytest.mark.parametrize("status, benched", [(401, True), (403, True), (502, False), (503, False)])
+def test_only_rejected_tokens_are_benched(tmp_path, monkeypatch, status, benched):
+    pool = TokenPool(["ghp_test"], db_path=str(tmp_path / "tasks.db"))
+    monkeypatch.setattr(github_utils, "_token_pool", pool)
+
+    async def get_authenticated_login(token):
+        raise auth_error(status)
+
+    monkeypatch.setattr(github_utils, "get_authenticated_login", get_authenticated_login)
+    assert asyncio.run(github_utils.create_and_push_repo("demo-repo", {})) == (None, None, None)
+    assert (pool.down_until[token_id("ghp_test")] > 0) == benched
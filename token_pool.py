@@ -0,0 +1,110 @@
+import os
+import time
+from contextlib import contextmanager
+from database import DB_PATH, transaction
+from helpers import hash_secret
+
+# === CONFIG ===
+GITHUB_TOKEN_MAX_FAILURES = int(os.getenv("GITHUB_TOKEN_MAX_FAILURES", "3"))
+GITHUB_TOKEN_COOLDOWN = float(os.getenv("GITHUB_TOKEN_COOLDOWN", "300"))
+# Assumed quota of a token GitHub hasn't reported on yet.
+GITHUB_DEFAULT_QUOTA = 5000
+
+
+def configured_tokens():
+    """Tokens from GITHUB_TOKENS (comma-separated), falling back to GITHUB_TOKEN."""
+    raw = os.getenv("GITHUB_TOKENS") or os.getenv("GITHUB_TOKEN") or ""
+    return [t.strip() for t in raw.split(",") if t.strip()]
+
+
+def token_id(token):
+    """Stable identifier for a token that is safe to store and log."""
+    return hash_secret(token)[:16]
+
+
+class TokenPool:
+    """Spreads deployments over several GitHub tokens (accounts).
+
+    New repos go to the healthy token with the fewest deployments in flight,
+    then the most remaining API quota (as reported by `quota(token)`). The
+    choice is persisted in `repo_owners`, so later rounds of the same repo
+    use the same token and owner. Tokens that fail repeatedly, or are
+    rejected outright, sit out for GITHUB_TOKEN_COOLDOWN seconds.
+    """
+
+    def __init__(self, tokens, db_path=DB_PATH, quota=None):
+        self.tokens = {token_id(t): t for t in tokens}
+        self.db_path = db_path
+        self.quota = quota or (lambda token: None)
+        self.load = dict.fromkeys(self.tokens, 0)
+        self.failures = dict.fromkeys(self.tokens, 0)
+        self.down_until = dict.fromkeys(self.tokens, 0.0)
+        self.init()
+
+    def init(self):
+        with transaction(self.db_path) as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS repo_owners (
+                    repo TEXT PRIMARY KEY,
+                    token_id TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    assigned_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+    def assignment(self, repo):
+        """(token_id, owner) previously assigned to `repo`, or None."""
+        with transaction(self.db_path) as cur:
+            cur.execute("SELECT token_id, owner FROM repo_owners WHERE repo=?", (repo,))
+            row = cur.fetchone()
+        return tuple(row) if row else None
+
+    def owner_of(self, repo):
+        assigned = self.assignment(repo)
+        return assigned[1] if assigned else None
+
+    def assign(self, repo, tid, owner):
+        with transaction(self.db_path) as cur:
+            cur.execute(
+                "INSERT INTO repo_owners (repo, token_id, owner) VALUES (?, ?, ?) "
+                "ON CONFLICT (repo) DO UPDATE SET token_id=excluded.token_id, owner=excluded.owner",
+                (repo, tid, owner),
+            )
+
+    def _rank(self, tid):
+        remaining = self.quota(self.tokens[tid])
+        return self.load[tid], -(GITHUB_DEFAULT_QUOTA if remaining is None else remaining)
+
+    def pick(self, repo):
+        """Token id for `repo`: its sticky assignment if that token is still configured,
+        else the best healthy token (or the one that recovers soonest if none are)."""
+        if not self.tokens:
+            raise RuntimeError("GITHUB_TOKEN not set")
+        assigned = self.assignment(repo)
+        if assigned and assigned[0] in self.tokens:
+            return assigned[0]
+        now = time.monotonic()
+        healthy = [tid for tid in self.tokens if self.down_until[tid] <= now]
+        if not healthy:
+            return min(self.tokens, key=self.down_until.get)
+        return min(healthy, key=self._rank)
+
+    @contextmanager
+    def lease(self, tid):
+        """Yield the token for `tid`, counted as one more deployment in flight meanwhile."""
+        self.load[tid] += 1
+        try:
+            yield self.tokens[tid]
+        finally:
+            self.load[tid] -= 1
+
+    def report(self, tid, ok, fatal=False):
+        """Record a deployment outcome; take the token out of rotation after repeated failures."""
+        if ok:
+            self.failures[tid] = 0
+            return
+        self.failures[tid] += 1
+        if fatal or self.failures[tid] >= GITHUB_TOKEN_MAX_FAILURES:
+            self.down_until[tid] = time.monotonic() + GITHUB_TOKEN_COOLDOWN
+            self.failures[tid] = 0
+            print(f"🚫 GitHub token {tid[:8]} marked unhealthy for {GITHUB_TOKEN_COOLDOWN:.0f}s")